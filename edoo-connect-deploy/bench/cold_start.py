@@ -0,0 +1,111 @@
+"""Cold start del backend: tiempo de import por módulo y latencia del primer request.
+
+Cada corrida arranca un intérprete nuevo con `python -X importtime`, importa
+src/main.py y hace un request con el cliente de pruebas de Flask, igual que
+la primera invocación de la función en Vercel.
+
+Uso:
+    python bench/cold_start.py [--runs 5] [--budget-ms 800] [--path /health] [--top 15]
+
+Sale con código 1 si la mediana de import + primer request supera --budget-ms.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+response = main.app.test_client().get(sys.argv[1])
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (finished - imported) * 1000,
+    'total_ms': (finished - started) * 1000,
+    'status': response.status_code,
+}))
+"""
+
+def parse_importtime(stderr):
+    """Líneas de -X importtime -> [(módulo, propio_us, acumulado_us, profundidad)]"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+def run_once(path):
+    env = dict(os.environ)
+    # El cliente de Supabase se crea en el primer uso; basta con valores de relleno
+    env.setdefault('SUPABASE_URL', 'http://127.0.0.1:9')
+    env.setdefault('SUPABASE_KEY', 'cold-start-bench')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, path],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-4000:])
+        raise SystemExit(f'cold start run failed with exit code {result.returncode}')
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('COLD_START_BUDGET_MS', '800')))
+    parser.add_argument('--path', default='/health')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--json', action='store_true', help='Imprime el resultado como JSON')
+    args = parser.parse_args()
+
+    # La primera corrida compila los .pyc; no representa un cold start de Vercel
+    run_once(args.path)
+    timings, modules = [], []
+    for _ in range(args.runs):
+        timing, modules = run_once(args.path)
+        timings.append(timing)
+
+    summary = {
+        key: statistics.median(t[key] for t in timings)
+        for key in ('import_ms', 'first_request_ms', 'total_ms')
+    }
+    # Solo dependencias directas de main (profundidad 1) para que el reporte sea accionable
+    direct = sorted((m for m in modules if m[3] == 1), key=lambda m: m[2], reverse=True)
+    main_entry = next((m for m in modules if m[0] == 'main'), None)
+    report = {
+        'runs': args.runs,
+        'path': args.path,
+        'status': timings[-1]['status'],
+        'budget_ms': args.budget_ms,
+        'median': summary,
+        'main_self_ms': main_entry[1] / 1000 if main_entry else None,
+        'imports': [{'module': name, 'cumulative_ms': cumulative / 1000, 'self_ms': own / 1000}
+                    for name, own, cumulative, _ in direct[:args.top]],
+    }
+    report['within_budget'] = summary['total_ms'] <= args.budget_ms
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"cold start ({args.runs} runs, GET {args.path} -> {report['status']})")
+        print(f"  import         {summary['import_ms']:8.1f} ms")
+        print(f"  first request  {summary['first_request_ms']:8.1f} ms")
+        print(f"  total          {summary['total_ms']:8.1f} ms  (budget {args.budget_ms:.0f} ms)")
+        print(f"\nslowest imports from main (cumulative / self):")
+        for item in report['imports']:
+            print(f"  {item['cumulative_ms']:8.1f} / {item['self_ms']:6.1f} ms  {item['module']}")
+        if report['main_self_ms'] is not None:
+            print(f"  main.py module body: {report['main_self_ms']:.1f} ms")
+    return 0 if report['within_budget'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
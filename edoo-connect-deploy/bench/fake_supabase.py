@@ -0,0 +1,303 @@
+"""Supabase local para benchmarks: GoTrue (signup, token, user) y PostgREST (simulations, profiles, rpc).
+
+Implementa solo lo que usa src/main.py, en memoria, con una latencia
+inyectada por request para simular la distancia a la base de datos real.
+Los tokens se firman con HS256, así que el backend puede verificarlos
+localmente con SUPABASE_JWT_SECRET igual que en producción.
+
+Uso:
+    python bench/fake_supabase.py [--port 54321] [--latency-ms 20] [--jitter-ms 5] [--storage text]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import jwt
+
+JWT_SECRET = 'bench-jwt-secret-bench-jwt-secret'
+# Con forma de JWT: supabase-py valida el formato de la API key
+ANON_KEY = 'bench.anon.key'
+TOKEN_TTL = 3600
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+class FakeSupabase:
+    """Estado en memoria: usuarios de GoTrue y filas de simulations (una por usuario)"""
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, storage='text'):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.storage = storage
+        self.users = {}  # email -> usuario
+        self.simulations = {}  # user_id -> fila
+        self.profiles = {}  # id -> fila
+        self.sign_outs = []  # user_id de cada POST /logout
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+    # GoTrue
+
+    def _user_payload(self, user):
+        return {
+            'id': user['id'], 'aud': 'authenticated', 'role': 'authenticated', 'email': user['email'],
+            'app_metadata': {'provider': 'email'}, 'user_metadata': {}, 'created_at': user['created_at']
+        }
+
+    def _session(self, user):
+        now = int(time.time())
+        access_token = jwt.encode({
+            'sub': user['id'], 'email': user['email'], 'aud': 'authenticated', 'role': 'authenticated',
+            'iat': now, 'exp': now + TOKEN_TTL
+        }, JWT_SECRET, algorithm='HS256')
+        return {
+            'access_token': access_token, 'token_type': 'bearer', 'expires_in': TOKEN_TTL,
+            'expires_at': now + TOKEN_TTL, 'refresh_token': uuid.uuid4().hex, 'user': self._user_payload(user)
+        }
+
+    def sign_up(self, body):
+        email = (body.get('email') or '').lower()
+        with self.lock:
+            if email in self.users:
+                return 400, {'msg': 'User already registered'}
+            user = {'id': str(uuid.uuid4()), 'email': email, 'password': body.get('password'), 'created_at': _now_iso()}
+            self.users[email] = user
+        return 200, self._session(user)
+
+    def sign_in(self, body):
+        user = self.users.get((body.get('email') or '').lower())
+        if user is None or user['password'] != body.get('password'):
+            return 400, {'error': 'invalid_grant', 'error_description': 'Invalid login credentials'}
+        return 200, self._session(user)
+
+    def get_user(self, token):
+        try:
+            claims = jwt.decode(token, JWT_SECRET, algorithms=['HS256'], audience='authenticated')
+        except jwt.InvalidTokenError:
+            return 401, {'msg': 'invalid JWT'}
+        user = self.users.get(claims.get('email'))
+        return (200, self._user_payload(user)) if user else (404, {'msg': 'User not found'})
+
+    def sign_out(self, token):
+        try:
+            claims = jwt.decode(token, JWT_SECRET, algorithms=['HS256'], audience='authenticated')
+        except jwt.InvalidTokenError:
+            return 401, {'msg': 'invalid JWT'}
+        with self.lock:
+            self.sign_outs.append(claims['sub'])
+        return 204, None
+
+    # PostgREST
+
+    def _store(self, value):
+        """Simula el tipo de la columna: text guarda strings JSON, jsonb guarda objetos"""
+        if self.storage == 'text':
+            return value if value is None or isinstance(value, str) else json.dumps(value)
+        return json.loads(value) if isinstance(value, str) and value else value
+
+    @staticmethod
+    def _as_json(value):
+        return json.loads(value) if isinstance(value, str) and value else value
+
+    @staticmethod
+    def _filters(query):
+        return {k: v[0][3:] for k, v in query.items() if v and v[0].startswith('eq.')}
+
+    def _project(self, row, select):
+        if not select or select == '*':
+            return dict(row)
+        result = {}
+        for column in select.split(','):
+            alias, _, expression = column.rpartition(':')
+            if '->' in expression:
+                name, _, key = expression.partition('->')
+                value = (self._as_json(row.get(name)) or {}).get(key)
+                result[alias or key] = value
+            else:
+                result[alias or expression] = row.get(expression)
+        return result
+
+    def select(self, table, query):
+        filters = self._filters(query)
+        if table == 'profiles':
+            with self.lock:
+                rows = [self.profiles[filters['id']]] if filters.get('id') in self.profiles else []
+                return 200, [self._project(row, query.get('select', ['*'])[0]) for row in rows]
+        if table != 'simulations':
+            return 200, []
+        with self.lock:
+            rows = [self.simulations[filters['user_id']]] if filters.get('user_id') in self.simulations else []
+            rows = [self._project(row, query.get('select', ['*'])[0]) for row in rows]
+        return 200, rows
+
+    def upsert(self, table, body):
+        rows = body if isinstance(body, list) else [body]
+        if table == 'profiles':
+            with self.lock:
+                for row in rows:
+                    self.profiles.setdefault(row['id'], {'id': row['id'], 'is_premium': False}).update(row)
+            return 201, None
+        with self.lock:
+            for row in rows:
+                existing = self.simulations.setdefault(row['user_id'], {
+                    'user_id': row['user_id'], 'wizard_data': self._store({}), 'status': 'draft',
+                    'step_versions': {}, 'report_data': None, 'report_hash': None, 'wizard_hash': None
+                })
+                for key, value in row.items():
+                    existing[key] = self._store(value) if key in ('wizard_data', 'report_data') else value
+        return 201, None
+
+    def update(self, table, query, body):
+        filters = self._filters(query)
+        with self.lock:
+            row = self.simulations.get(filters.get('user_id'))
+            if row is not None:
+                for key, value in body.items():
+                    row[key] = self._store(value) if key in ('wizard_data', 'report_data') else value
+        return 204, None
+
+    def save_simulation(self, params):
+        """Como migrations/006_save_simulation.sql: escribe solo si cambió el wizard_hash guardado"""
+        user_id = params['p_user_id']
+        with self.lock:
+            row = self.simulations.get(user_id)
+            if row is not None and row['wizard_hash'] == params['p_wizard_hash']:
+                return 200, False
+            if row is None:
+                row = self.simulations[user_id] = {
+                    'user_id': user_id, 'status': 'draft', 'step_versions': {},
+                    'report_data': None, 'report_hash': None
+                }
+            row['wizard_data'] = self._store(params['p_wizard_data'])
+            row['wizard_hash'] = params['p_wizard_hash']
+        return 200, True
+
+    def apply_premium_updates(self, params):
+        """Como migrations/007_apply_premium_updates.sql: no pisa una fila con un evento más viejo"""
+        applied = []
+        with self.lock:
+            for row in params['p_updates']:
+                existing = self.profiles.get(row['id'])
+                updated_at = datetime.fromisoformat(row['premium_updated_at'])
+                if existing is not None and existing.get('premium_updated_at') \
+                        and datetime.fromisoformat(existing['premium_updated_at']) >= updated_at:
+                    continue
+                self.profiles.setdefault(row['id'], {'id': row['id'], 'is_premium': False}).update(row)
+                applied.append({'user_id': row['id']})
+        return 200, applied
+
+    def merge_simulation_step(self, params):
+        user_id, step = params['p_user_id'], params['p_step']
+        with self.lock:
+            row = self.simulations.setdefault(user_id, {
+                'user_id': user_id, 'wizard_data': self._store({}), 'status': 'draft',
+                'step_versions': {}, 'report_data': None, 'report_hash': None, 'wizard_hash': None
+            })
+            current = row['step_versions'].get(step, 0)
+            expected = params.get('p_expected_version')
+            if expected is not None and expected != current:
+                return 200, [{'new_version': current, 'conflict': True}]
+            wizard = self._as_json(row['wizard_data']) or {}
+            wizard[step] = {**(wizard.get(step) or {}), **params['p_data']}
+            row['wizard_data'] = self._store(wizard)
+            row['step_versions'] = {**row['step_versions'], step: current + 1}
+            row['wizard_hash'] = None
+        return 200, [{'new_version': current + 1, 'conflict': False}]
+
+class FakeSupabaseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como el gateway de Supabase
+    # Headers y body salen en writes separados; con Nagle + delayed ACK cada respuesta sumaría ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        return json.loads(self._raw_body) if self._raw_body else {}
+
+    def _send(self, status, payload):
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        state = self.server.state
+        with state.lock:
+            state.requests += 1
+        # Siempre se consume el body: si queda en el socket rompe el siguiente request keep-alive
+        self._raw_body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        state.delay()
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = url.path
+        if path == '/auth/v1/signup' and method == 'POST':
+            return self._send(*state.sign_up(self._body()))
+        if path == '/auth/v1/token' and method == 'POST':
+            return self._send(*state.sign_in(self._body()))
+        if path == '/auth/v1/logout' and method == 'POST':
+            return self._send(*state.sign_out(self.headers.get('Authorization', '')[len('Bearer '):]))
+        if path == '/auth/v1/user' and method == 'GET':
+            return self._send(*state.get_user(self.headers.get('Authorization', '')[len('Bearer '):]))
+        if path == '/rest/v1/rpc/merge_simulation_step' and method == 'POST':
+            return self._send(*state.merge_simulation_step(self._body()))
+        if path == '/rest/v1/rpc/save_simulation' and method == 'POST':
+            return self._send(*state.save_simulation(self._body()))
+        if path == '/rest/v1/rpc/apply_premium_updates' and method == 'POST':
+            return self._send(*state.apply_premium_updates(self._body()))
+        if path.startswith('/rest/v1/'):
+            table = path[len('/rest/v1/'):]
+            if method == 'GET':
+                return self._send(*state.select(table, query))
+            if method == 'POST':
+                return self._send(*state.upsert(table, self._body()))
+            if method == 'PATCH':
+                return self._send(*state.update(table, query, self._body()))
+        print(f'fake Supabase: {method} {self.path} not implemented')
+        return self._send(404, {'message': f'{method} {path} not implemented by the fake'})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+def start(port=0, latency_ms=0.0, jitter_ms=0.0, storage='text'):
+    """Arranca el fake en un thread; devuelve (server, url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeSupabaseHandler)
+    server.daemon_threads = True
+    server.state = FakeSupabase(latency_ms, jitter_ms, storage)
+    threading.Thread(target=server.serve_forever, name='fake-supabase', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--storage', choices=('text', 'jsonb'), default='text')
+    args = parser.parse_args()
+    server, url = start(args.port, args.latency_ms, args.jitter_ms, args.storage)
+    print(f'fake Supabase on {url} (latency {args.latency_ms}±{args.jitter_ms} ms, storage {args.storage})')
+    print(f'  SUPABASE_URL={url} SUPABASE_KEY={ANON_KEY} SUPABASE_JWT_SECRET={JWT_SECRET}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Load test de los endpoints de src/main.py contra un Supabase local.
+
+Por defecto arranca en este proceso el fake de Supabase (fake_supabase.py,
+con latencia inyectada) y la app Flask sobre un servidor WSGI con threads,
+y recorre cada escenario a varios niveles de concurrencia reportando
+throughput y latencias p50/p95/p99. Con --target se mide un servidor ya
+levantado (p. ej. gunicorn apuntando a `python bench/fake_supabase.py`).
+
+Uso:
+    python bench/load.py [--levels 1,8,32] [--requests 300] [--latency-ms 20]
+                         [--scenarios health,simulation_get] [--target http://127.0.0.1:5000]
+                         [--fail-on-regression 15]
+
+Los resultados quedan en bench/results/ y se comparan con la corrida anterior.
+Sale con código 1 si --fail-on-regression está activo y alguna combinación
+escenario/concurrencia pierde más de ese porcentaje de throughput.
+"""
+import argparse
+import hashlib
+import hmac
+import http.client
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import fake_supabase
+import results
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+# Con --target, el backend debe tener este mismo PAYMENT_WEBHOOK_SECRET
+WEBHOOK_SECRET = os.environ.get('PAYMENT_WEBHOOK_SECRET', 'whsec_bench')
+
+WIZARD = {
+    'step1': {'name': 'Bench'},
+    'step3': {'familyStatus': 'couple'},
+    'step5': {'currentSavings': 45000, 'monthlyIncome': 500, 'workHours': 10},
+    'step6': {'country': 'canada'},
+    'step7': {'state': 'ontario', 'city': 'toronto'},
+}
+
+def start_local_app(args):
+    """Fake de Supabase + app en threads de este proceso; devuelve la URL base de la app"""
+    _, supabase_url = fake_supabase.start(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, storage=args.storage)
+    os.environ.update({
+        'SUPABASE_URL': supabase_url,
+        'SUPABASE_KEY': fake_supabase.ANON_KEY,
+        'SIMULATION_STORAGE': args.storage,
+        'PAYMENT_WEBHOOK_SECRET': WEBHOOK_SECRET,
+    })
+    # El access log por request ensuciaría la tabla de resultados
+    os.environ.setdefault('LOG_SAMPLE_RATE', '0')
+    if args.remote_auth:
+        os.environ.pop('SUPABASE_JWT_SECRET', None)
+    else:
+        os.environ['SUPABASE_JWT_SECRET'] = fake_supabase.JWT_SECRET
+    sys.path.insert(0, SRC_DIR)
+    import main
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, main.app, threaded=True, request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+class Client:
+    """Conexión keep-alive por worker; reconecta si el servidor la cierra"""
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=data, headers=headers)
+                response = self.conn.getresponse()
+                payload = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.conn.close()
+                    self.conn = None
+                return response.status, payload, response
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+def create_users(base_url, count):
+    """Registra, inicia sesión y guarda un wizard por usuario; devuelve los headers de auth"""
+    client = Client(base_url)
+    users = []
+    for _ in range(count):
+        email = f'bench-{uuid.uuid4().hex[:12]}@example.com'
+        client.request('POST', '/api/auth/register', {'name': 'Bench', 'email': email, 'password': 'bench-password'})
+        status, payload, _ = client.request('POST', '/api/auth/login', {'email': email, 'password': 'bench-password'})
+        if status != 200:
+            raise SystemExit(f'login failed while creating bench users: {status} {payload[:200]}')
+        token = json.loads(payload)['data']['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        client.request('POST', '/api/simulations', WIZARD, headers)
+        client.request('POST', '/api/reports/generate', {}, headers)
+        status, _, response = client.request('GET', '/api/simulations/current', headers=headers)
+        status, payload, _ = client.request('GET', '/api/auth/profile', headers=headers)
+        users.append({'email': email, 'id': json.loads(payload)['data']['user']['id'], 'headers': headers,
+                      'simulation_etag': response.getheader('ETag')})
+    return users
+
+def webhook_request(user, i):
+    """Evento de pago firmado como Stripe; el id es único por request, así que no cuenta como duplicado"""
+    event = {
+        'id': f'evt_{uuid.uuid4().hex}', 'type': 'customer.subscription.updated', 'created': int(time.time()),
+        'data': {'object': {'status': 'active' if i % 2 else 'canceled', 'metadata': {'user_id': user['id']}}},
+    }
+    # Client serializa el body con json.dumps, así que la firma cubre los mismos bytes
+    body = json.dumps(event).encode('utf-8')
+    timestamp = str(int(time.time()))
+    signature = hmac.new(WEBHOOK_SECRET.encode('utf-8'), timestamp.encode('ascii') + b'.' + body, hashlib.sha256).hexdigest()
+    return 'POST', '/api/payments/webhook', event, {'Stripe-Signature': f't={timestamp},v1={signature}'}
+
+# Cada escenario recibe (usuario, número de request) y devuelve (método, path, body, headers)
+SCENARIOS = {
+    'health': lambda user, i: ('GET', '/health', None, {}),
+    'static': lambda user, i: ('GET', '/', None, {'Accept-Encoding': 'gzip'}),
+    'register': lambda user, i: ('POST', '/api/auth/register', {
+        'name': 'Bench', 'email': f'load-{uuid.uuid4().hex}@example.com', 'password': 'bench-password'}, {}),
+    'login': lambda user, i: ('POST', '/api/auth/login', {'email': user['email'], 'password': 'bench-password'}, {}),
+    'profile': lambda user, i: ('GET', '/api/auth/profile', None, user['headers']),
+    'simulation_save': lambda user, i: ('POST', '/api/simulations', {
+        **WIZARD, 'step5': {**WIZARD['step5'], 'currentSavings': 40000 + i}}, user['headers']),
+    'simulation_step': lambda user, i: ('PATCH', '/api/simulations/step/5', {
+        'data': {'currentSavings': 40000 + i}}, user['headers']),
+    'simulation_get': lambda user, i: ('GET', '/api/simulations/current', None, user['headers']),
+    'simulation_get_304': lambda user, i: ('GET', '/api/simulations/current', None, {
+        **user['headers'], 'If-None-Match': user['simulation_etag'] or '*'}),
+    'report_generate': lambda user, i: ('POST', '/api/reports/generate', {}, user['headers']),
+    'report_generate_mc': lambda user, i: ('POST', '/api/reports/generate', {
+        'risk': {'mode': 'monte_carlo', 'paths': 2000, 'seed': i}}, user['headers']),
+    'report_current': lambda user, i: ('GET', '/api/reports/current', None, user['headers']),
+    'what_if': lambda user, i: ('POST', '/api/reports/what-if', {
+        'base': WIZARD, 'axes': [{'field': 'step5.currentSavings', 'values': list(range(20000, 70000, 5000))},
+                                 {'field': 'step3.familyStatus', 'values': ['single', 'couple', 'family']}]}, user['headers']),
+    'generate_batch': lambda user, i: ('POST', '/api/reports/generate-batch', {
+        'profiles': [WIZARD] * 200}, user['headers']),
+    'report_pdf': lambda user, i: ('GET', '/api/reports/export/pdf', None, user['headers']),
+    'webhook': webhook_request,
+}
+
+# Escenarios que al repetirse cambian el estado de los demás: se corren al final
+STATEFUL = ('register', 'simulation_save', 'simulation_step', 'report_generate_mc', 'webhook')
+
+def run_level(base_url, scenario, users, concurrency, total):
+    """Lanza `total` requests con `concurrency` workers; devuelve métricas del nivel"""
+    build = SCENARIOS[scenario]
+    counter = itertools.count()
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(user):
+        client = Client(base_url)
+        own, failed = [], 0
+        while True:
+            i = next(counter)
+            if i >= total:
+                break
+            method, path, body, headers = build(user, i)
+            started = time.perf_counter()
+            try:
+                status, _, _ = client.request(method, path, body, headers)
+            except (OSError, http.client.HTTPException):
+                status = 599
+            own.append(time.perf_counter() - started)
+            if status >= 400 and not (scenario == 'register' and status == 409):
+                failed += 1
+        with lock:
+            latencies.extend(own)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(users[n % len(users)],)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'rps': round(total / elapsed, 2),
+        'errors': sum(errors),
+        **results.latency_summary(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', default='1,8,32', help='Niveles de concurrencia separados por coma')
+    parser.add_argument('--requests', type=int, default=300, help='Requests por escenario y nivel')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Latencia inyectada por llamada a Supabase')
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--storage', choices=('text', 'jsonb'), default='text')
+    parser.add_argument('--remote-auth', action='store_true', help='Sin SUPABASE_JWT_SECRET: verifica tokens contra GoTrue')
+    parser.add_argument('--target', help='URL de un backend ya levantado en lugar del servidor en proceso')
+    parser.add_argument('--fail-on-regression', type=float, default=None, metavar='PCT')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',')]
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(unknown)}')
+    scenarios.sort(key=lambda name: name in STATEFUL)
+
+    base_url = args.target or start_local_app(args)
+    users = create_users(base_url, max(levels))
+
+    measured = {}
+    print(f"{'scenario':<22}{'conc':>5}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for scenario in scenarios:
+        # Calienta cachés y conexiones para que el primer nivel no pague el arranque
+        run_level(base_url, scenario, users, 1, min(10, args.requests))
+        for level in levels:
+            stats = run_level(base_url, scenario, users, level, args.requests)
+            measured[f'{scenario}@c{level}'] = stats
+            print(f"{scenario:<22}{level:>5}{stats['rps']:>10.1f}{stats['p50_ms']:>10.2f}"
+                  f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}")
+
+    params = {key: getattr(args, key) for key in ('levels', 'requests', 'latency_ms', 'jitter_ms', 'storage', 'remote_auth', 'target')}
+    current = {'results': measured}
+    path = None if args.no_save else results.save('load', params, measured)
+    baseline = results.previous('load', exclude=path)
+    exit_code = 0
+    if baseline is not None:
+        if baseline.get('params') != params:
+            print('\n(note: previous run used different parameters)')
+        rows = results.compare(current, baseline, 'rps', higher_is_better=True, threshold=args.fail_on_regression if args.fail_on_regression is not None else 10)
+        results.print_comparison(rows, 'rps', baseline)
+        if args.fail_on_regression is not None and any(row[4] for row in rows):
+            exit_code = 1
+    if path:
+        print(f'\nsaved {os.path.relpath(path)}')
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Microbenchmarks del motor financiero de src/main.py (sin HTTP ni Supabase).
+
+Uso:
+    python bench/micro.py [--repeat 7] [--only analysis_single,monte_carlo_10k] [--fail-on-regression 15]
+
+Reporta la mediana y el mejor tiempo por llamada, guarda el resultado en
+bench/results/ y lo compara con la corrida anterior.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import timeit
+
+import results
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+WIZARD = {
+    'step3': {'familyStatus': 'couple'},
+    'step5': {'currentSavings': 45000, 'monthlyIncome': 500, 'workHours': 10},
+    'step6': {'country': 'canada'},
+    'step7': {'state': 'ontario', 'city': 'toronto'},
+}
+
+def load_main():
+    # El cliente de Supabase es perezoso: el motor no lo necesita
+    os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:9')
+    os.environ.setdefault('SUPABASE_KEY', 'bench.anon.key')
+    sys.path.insert(0, SRC_DIR)
+    import main
+    return main
+
+def build_cases(main):
+    analysis = main.calculate_financial_analysis(WIZARD)
+    profiles = [
+        {**WIZARD, 'step3': {'familyStatus': status}, 'step5': {'currentSavings': savings},
+         'step6': {'country': country}, 'step7': {'city': city}}
+        for status, savings, country, city in zip(
+            ('single', 'couple', 'family') * 3334, range(0, 10_000_000, 1000),
+            ('canada', 'usa') * 5000, ('toronto', 'vancouver', 'new-york-city', 'los-angeles', 'ottawa') * 2000)
+    ][:10_000]
+    axes = [
+        ('step5.currentSavings', list(range(0, 100_000, 1000))),
+        ('step3.familyStatus', ['single', 'couple', 'family']),
+    ]
+    return {
+        'analysis_single': lambda: main.calculate_financial_analysis(WIZARD),
+        'analysis_scalar_1k': lambda: [main.calculate_financial_analysis(p) for p in profiles[:1000]],
+        'analysis_batch_10k': lambda: main.calculate_financial_analysis_batch(profiles),
+        'cash_flow_120m': lambda: main.generate_cash_flow_projection(analysis, WIZARD, months=120, inflation=0.03),
+        'monte_carlo_10k': lambda: main.simulate_risk_monte_carlo(analysis, WIZARD, months=24, paths=10_000, seed=1),
+        'what_if_300_cells': lambda: main.evaluate_what_if_grid(WIZARD, axes),
+        'report_cache_key': lambda: main.report_cache_key(WIZARD, {'projection': {'months': 24}}),
+    }
+
+def measure(fn, repeat):
+    """Calibra `number` para ~0.2 s por muestra (timeit.autorange); tiempos por llamada"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'median_us': round(statistics.median(samples) * 1e6, 3),
+        'best_us': round(min(samples) * 1e6, 3),
+        'calls_per_sample': number,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--only', default='')
+    parser.add_argument('--fail-on-regression', type=float, default=None, metavar='PCT')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    cases = build_cases(load_main())
+    selected = [name for name in args.only.split(',') if name] or list(cases)
+    measured = {}
+    for name in selected:
+        cases[name]()  # calienta la base de costos y los imports perezosos
+        started = time.perf_counter()
+        measured[name] = measure(cases[name], args.repeat)
+        print(f"{name:<22} median {measured[name]['median_us']:>12.1f} us   best {measured[name]['best_us']:>12.1f} us"
+              f"   ({time.perf_counter() - started:.1f} s)")
+
+    params = {'repeat': args.repeat}
+    path = None if args.no_save else results.save('micro', params, measured)
+    baseline = results.previous('micro', exclude=path)
+    exit_code = 0
+    if baseline is not None:
+        rows = results.compare({'results': measured}, baseline, 'median_us', higher_is_better=False,
+                               threshold=args.fail_on_regression if args.fail_on_regression is not None else 10)
+        results.print_comparison(rows, 'median_us', baseline)
+        if args.fail_on_regression is not None and any(row[4] for row in rows):
+            exit_code = 1
+    if path:
+        print(f'\nsaved {os.path.relpath(path)}')
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Guardado y comparación de resultados de benchmark entre commits.
+
+Cada corrida escribe bench/results/<kind>-<fecha>-<commit>.json (ignorado por git).
+compare() contrasta una corrida con la anterior del mismo tipo.
+"""
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=RESULTS_DIR.rsplit(os.sep, 1)[0], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile(sorted_values, q):
+    """Percentil con interpolación lineal sobre una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+def save(kind, params, results):
+    """Escribe la corrida con el commit actual; devuelve la ruta"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    commit = _git('rev-parse', '--short', 'HEAD') or 'unknown'
+    dirty = bool(_git('status', '--porcelain', '--', '..'))
+    payload = {
+        'kind': kind,
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': params,
+        'results': results,
+    }
+    path = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{commit}{'-dirty' if dirty else ''}.json")
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    return path
+
+def previous(kind, exclude=None):
+    """Corrida anterior del mismo tipo (la más reciente distinta de `exclude`)"""
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, f'{kind}-*.json')) if p != exclude)
+    if not paths:
+        return None
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+def compare(current, baseline, metric, higher_is_better, threshold):
+    """Filas (clave, antes, después, cambio %, regresión) para las claves presentes en ambas corridas"""
+    rows = []
+    for key, values in current['results'].items():
+        before = baseline['results'].get(key, {}).get(metric)
+        after = values.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        regressed = change < -threshold if higher_is_better else change > threshold
+        rows.append((key, before, after, change, regressed))
+    return rows
+
+def print_comparison(rows, metric, baseline):
+    print(f"\nvs {baseline['commit']}{' (dirty)' if baseline.get('dirty') else ''} from {baseline['timestamp']} ({metric}):")
+    for key, before, after, change, regressed in rows:
+        print(f"  {key:<40} {before:>10.2f} -> {after:>10.2f}  {change:+6.1f}%{'  REGRESSION' if regressed else ''}")
@@ -0,0 +1,72 @@
+# Configuración de gunicorn para correr el backend fuera de Vercel (workers de larga vida).
+#
+#   cd edoo-connect-deploy && gunicorn --chdir src main:app
+#
+# GUNICORN_WORKER_CLASS=gevent (requiere `pip install gevent`) convierte cada
+# request en un greenlet: mientras espera a Supabase no ocupa un thread, así
+# que un worker sostiene cientos de requests en vuelo (GUNICORN_WORKER_CONNECTIONS).
+# Sin gevent se usa gthread con GUNICORN_THREADS threads por worker.
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:" + os.environ.get("PORT", "5000"))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("GUNICORN_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))  # Solo gthread
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "500"))  # Solo gevent
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30  # Deja terminar el flush del write-behind y las escrituras en segundo plano
+
+# El write-behind (SIMULATION_WRITE_BEHIND) y las escrituras en segundo plano (ASYNC_IO)
+# solo dan read-your-writes dentro de un proceso: el guardado pendiente, el wait() del
+# write-back del reporte y el flush previo a un PATCH o generate viven en la memoria del
+# worker. Con varios workers, el siguiente request del usuario puede caer en otro que
+# todavía lee la fila vieja. Por eso se activan solos únicamente con un worker; con más,
+# son opt-in y solo son correctos si el balanceador fija cada usuario a un worker.
+#
+# Las métricas de /metrics también son de cada worker y un scrape llega a uno cualquiera:
+# con varios workers cada uno las publica en METRICS_DIR y el que responde devuelve las de
+# todos (con un label worker). Por defecto, un directorio por master.
+#
+# Todo se decide en on_starting con el número efectivo de workers (server.cfg.workers):
+# `-w` o WEB_CONCURRENCY pisan la variable `workers` de este archivo.
+_ASYNC_FLAGS = ("SIMULATION_WRITE_BEHIND", "ASYNC_IO")
+_defaulted_flags = [name for name in _ASYNC_FLAGS if name not in os.environ]
+
+def _configure_workers(server):
+    effective = server.cfg.workers
+    # Los workers heredan os.environ del master al hacer fork
+    for name in _defaulted_flags:
+        os.environ[name] = "true" if effective == 1 else "false"
+    enabled = [name for name in _ASYNC_FLAGS if os.environ.get(name, "").lower() == "true"]
+    if effective > 1 and enabled:
+        server.log.warning(
+            "%s con %d workers: read-your-writes solo dentro de cada worker; "
+            "fijar cada usuario a un worker en el balanceador", ", ".join(enabled), effective
+        )
+    if effective > 1 and not os.environ.get("METRICS_DIR"):
+        os.environ["METRICS_DIR"] = os.path.join(tempfile.gettempdir(), f"edooconnect-metrics-{os.getpid()}")
+
+def on_starting(server):
+    _configure_workers(server)
+
+def on_reload(server):
+    _configure_workers(server)
+
+def _remove_metrics(pattern):
+    directory = os.environ.get("METRICS_DIR")
+    if directory:
+        for path in glob.glob(os.path.join(directory, pattern)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def child_exit(server, worker):
+    _remove_metrics(f"{worker.pid}.prom")
+
+def on_exit(server):
+    _remove_metrics("*.prom*")
@@ -0,0 +1,13 @@
+-- Permite guardar simulaciones con un único upsert por user_id y
+-- detectar guardados sin cambios mediante el hash del contenido.
+
+-- Conservar solo la simulación más reciente de cada usuario
+delete from simulations s
+using simulations newer
+where s.user_id = newer.user_id
+  and (s.created_at, s.id) < (newer.created_at, newer.id);
+
+create unique index if not exists simulations_user_id_key on simulations (user_id);
+
+alter table simulations add column if not exists wizard_hash text;
+alter table simulations alter column status set default 'draft';
@@ -0,0 +1,46 @@
+-- Guardado por paso del wizard (PATCH /api/simulations/step/<n>).
+-- El merge se hace en la base de datos para que solo viaje el paso editado,
+-- con una versión por paso para detectar escrituras concurrentes.
+
+alter table simulations add column if not exists step_versions jsonb not null default '{}'::jsonb;
+
+create or replace function merge_simulation_step(
+    p_user_id uuid,
+    p_step text,
+    p_data jsonb,
+    p_expected_version integer default null
+)
+returns table (new_version integer, conflict boolean)
+language plpgsql
+as $$
+declare
+    v_current integer;
+    v_wizard jsonb;
+begin
+    insert into simulations (user_id, wizard_data, status)
+    values (p_user_id, '{}', 'draft')
+    on conflict (user_id) do nothing;
+
+    select coalesce((s.step_versions ->> p_step)::integer, 0),
+           coalesce(nullif(s.wizard_data, '')::jsonb, '{}'::jsonb)
+      into v_current, v_wizard
+      from simulations s
+     where s.user_id = p_user_id
+       for update;
+
+    if p_expected_version is not null and p_expected_version <> v_current then
+        return query select v_current, true;
+        return;
+    end if;
+
+    update simulations s
+       set wizard_data = (v_wizard || jsonb_build_object(
+                             p_step, coalesce(v_wizard -> p_step, '{}'::jsonb) || p_data))::text,
+           step_versions = s.step_versions || jsonb_build_object(p_step, v_current + 1),
+           wizard_hash = null,
+           created_at = now()
+     where s.user_id = p_user_id;
+
+    return query select v_current + 1, false;
+end;
+$$;
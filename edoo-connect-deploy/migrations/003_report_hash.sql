@@ -0,0 +1,4 @@
+-- Hash de las entradas del motor financiero con las que se generó report_data.
+-- Si coincide con el del wizard actual, el reporte guardado sigue vigente.
+
+alter table simulations add column if not exists report_hash text;
@@ -0,0 +1,68 @@
+-- wizard_data/report_data como jsonb nativo (SIMULATION_STORAGE=jsonb).
+-- Permite leer pasos sueltos (select=step3:wizard_data->step3) en lugar del documento completo.
+--
+-- Orden de despliegue: aplicar esta migración, desplegar, y luego activar
+-- SIMULATION_STORAGE=jsonb. Mientras tanto el modo "text" sigue funcionando:
+-- sus strings quedan como strings JSON dentro de jsonb y la API los decodifica igual.
+
+alter table simulations
+    alter column wizard_data type jsonb
+    using coalesce(nullif(wizard_data, '')::jsonb, '{}'::jsonb);
+alter table simulations alter column wizard_data set default '{}'::jsonb;
+
+alter table simulations
+    alter column report_data type jsonb
+    using nullif(report_data, '')::jsonb;
+
+-- Normaliza los strings JSON escritos en modo "text" después de la migración
+create or replace function simulations_unwrap_json(p_value jsonb)
+returns jsonb
+language sql
+immutable
+as $$
+    select case when jsonb_typeof(p_value) = 'string'
+                then (p_value #>> '{}')::jsonb
+                else p_value end;
+$$;
+
+-- Igual que en 002, pero sobre la columna jsonb
+create or replace function merge_simulation_step(
+    p_user_id uuid,
+    p_step text,
+    p_data jsonb,
+    p_expected_version integer default null
+)
+returns table (new_version integer, conflict boolean)
+language plpgsql
+as $$
+declare
+    v_current integer;
+    v_wizard jsonb;
+begin
+    insert into simulations (user_id, wizard_data, status)
+    values (p_user_id, '{}'::jsonb, 'draft')
+    on conflict (user_id) do nothing;
+
+    select coalesce((s.step_versions ->> p_step)::integer, 0),
+           coalesce(simulations_unwrap_json(s.wizard_data), '{}'::jsonb)
+      into v_current, v_wizard
+      from simulations s
+     where s.user_id = p_user_id
+       for update;
+
+    if p_expected_version is not null and p_expected_version <> v_current then
+        return query select v_current, true;
+        return;
+    end if;
+
+    update simulations s
+       set wizard_data = v_wizard || jsonb_build_object(
+                             p_step, coalesce(v_wizard -> p_step, '{}'::jsonb) || p_data),
+           step_versions = s.step_versions || jsonb_build_object(p_step, v_current + 1),
+           wizard_hash = null,
+           created_at = now()
+     where s.user_id = p_user_id;
+
+    return query select v_current + 1, false;
+end;
+$$;
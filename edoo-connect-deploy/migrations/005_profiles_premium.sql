@@ -0,0 +1,10 @@
+-- Plan de cada usuario, escrito por el webhook de pagos (POST /api/payments/webhook).
+-- El backend hace un upsert por lote de eventos, así que la fila puede no existir antes.
+
+create table if not exists profiles (
+    id uuid primary key references auth.users (id) on delete cascade,
+    created_at timestamptz not null default now()
+);
+
+alter table profiles add column if not exists is_premium boolean not null default false;
+alter table profiles add column if not exists premium_updated_at timestamptz;
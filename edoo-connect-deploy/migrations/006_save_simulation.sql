@@ -0,0 +1,31 @@
+-- Guardado completo del wizard (POST /api/simulations) que decide en la base si hay cambios.
+-- Compara con el wizard_hash guardado, no con un caché del worker: con varios workers
+-- (o un PATCH por paso, que deja wizard_hash en null) la fila puede haber cambiado
+-- desde el último guardado que vio este proceso. Devuelve true si escribió.
+--
+-- p_wizard_data es jsonb en los dos modos de SIMULATION_STORAGE: si la columna
+-- sigue siendo text (sin 004), la asignación la convierte a su texto JSON.
+
+create or replace function save_simulation(
+    p_user_id uuid,
+    p_wizard_data jsonb,
+    p_wizard_hash text
+)
+returns boolean
+language plpgsql
+as $$
+declare
+    v_written boolean;
+begin
+    insert into simulations (user_id, wizard_data, wizard_hash, created_at)
+    values (p_user_id, p_wizard_data, p_wizard_hash, now())
+    on conflict (user_id) do update
+       set wizard_data = excluded.wizard_data,
+           wizard_hash = excluded.wizard_hash,
+           created_at = excluded.created_at
+     where simulations.wizard_hash is distinct from excluded.wizard_hash
+    returning true into v_written;
+
+    return coalesce(v_written, false);
+end;
+$$;
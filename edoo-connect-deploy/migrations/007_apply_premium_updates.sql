@@ -0,0 +1,22 @@
+-- Aplica un lote de cambios de plan del webhook de pagos (apply_premium_updates en main.py).
+-- Los eventos pueden llegar desordenados entre lotes (reintentos del proveedor, un
+-- reenvío manual, otro worker): una fila solo se pisa con un evento más nuevo que
+-- el que la escribió. Devuelve los usuarios que sí se actualizaron.
+--
+-- p_updates: [{"id": uuid, "is_premium": bool, "premium_updated_at": timestamptz}, ...]
+-- con a lo sumo una entrada por usuario.
+
+create or replace function apply_premium_updates(p_updates jsonb)
+returns table (user_id uuid)
+language sql
+as $$
+    insert into profiles as p (id, is_premium, premium_updated_at)
+    select u.id, u.is_premium, u.premium_updated_at
+      from jsonb_to_recordset(p_updates) as u(id uuid, is_premium boolean, premium_updated_at timestamptz)
+    on conflict (id) do update
+       set is_premium = excluded.is_premium,
+           premium_updated_at = excluded.premium_updated_at
+     where p.premium_updated_at is null
+        or p.premium_updated_at < excluded.premium_updated_at
+    returning p.id;
+$$;
@@ -1,29 +1,587 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
 import time
 import json
 import hashlib
+import hmac
 import jwt
-from datetime import datetime, timedelta
-from supabase import create_client, Client
-import traceback
+import csv
+import io
+import gzip
+import mimetypes
+import atexit
+import threading
+import itertools
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # In requirements.txt; if missing, only gzip variants are served
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib json module
+    orjson = None
+
+import pdf_report
+
+def json_dumps(value):
+    """Serializa a texto JSON compacto con orjson si está disponible"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:  # p. ej. enteros de más de 64 bits
+            pass
+    return json.dumps(value, separators=(',', ':'))
+
+def json_loads(value):
+    return orjson.loads(value) if orjson is not None else json.loads(value)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify/get_json a través de orjson.
+
+    jsonify siempre pasa separators (compacto) o indent (debug), así que se
+    traducen a opciones de orjson en lugar de caer al módulo json.
+    """
+    # Orden de inserción, como orjson; en True se ordena con OPT_SORT_KEYS
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        options = dict(kwargs)
+        options.pop('separators', None)  # orjson ya es compacto
+        indent = options.pop('indent', None)
+        sort_keys = options.pop('sort_keys', self.sort_keys)
+        if options or indent not in (None, 2):
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except TypeError:  # p. ej. enteros de más de 64 bits
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app, origins=["*"]) # Consider restricting origins in production
 
 # Supabase Configuration
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+SUPABASE_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", "100")) # Keep-alive connections to PostgREST per worker
+
+_supabase = None
+_supabase_auth = None
+_supabase_lock = threading.Lock()
+
+def _create_supabase_client(**options):
+    from supabase import create_client  # ~0.5 s de imports (httpx, postgrest, gotrue)
+    from supabase.lib.client_options import ClientOptions
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(**options))
+
+def _pool_connections(client):
+    """Reemplaza la sesión HTTP de PostgREST por una con SUPABASE_POOL_SIZE conexiones keep-alive"""
+    import httpx
+    postgrest = client.postgrest
+    session = postgrest.session
+    postgrest.session = type(session)(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        limits=httpx.Limits(max_connections=SUPABASE_POOL_SIZE, max_keepalive_connections=SUPABASE_POOL_SIZE)
+    )
+    session.close()
+
+def get_supabase():
+    """Cliente de datos (tablas y rpc), creado en el primer uso y no en cada cold start.
+
+    Nunca inicia sesión: un login en el cliente compartido recrea el cliente
+    de PostgREST (perdiendo las conexiones keep-alive) y le pone el token de
+    ese usuario a todas las consultas siguientes.
+    """
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                client = _create_supabase_client(persist_session=False, auto_refresh_token=False)
+                _pool_connections(client)
+                _supabase = client
+    return _supabase
+
+def get_auth_client():
+    """Cliente para GoTrue (registro, login y verificación remota de tokens)"""
+    global _supabase_auth
+    if _supabase_auth is None:
+        with _supabase_lock:
+            if _supabase_auth is None:
+                _supabase_auth = _create_supabase_client()
+    return _supabase_auth
 
 # Configuración
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "super-secret-jwt-key") # Use environment variable for secret key
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET") # Project JWT secret (Settings > API) for local verification
+AUTH_CACHE_TTL = int(os.environ.get("AUTH_CACHE_TTL", "300")) # Seconds a verified token stays cached
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "10000"))
+AUTH_REVOCATION_TTL = int(os.environ.get("AUTH_REVOCATION_TTL", "86400")) # Should cover the longest token lifetime
+WIZARD_STEPS = 11
+# "text": wizard_data/report_data guardados como strings json.dumps (esquema original).
+# "jsonb": columnas nativas, permite leer solo los pasos necesarios (migrations/004_simulations_jsonb.sql).
+SIMULATION_STORAGE = os.environ.get("SIMULATION_STORAGE", "text").lower()
+# Seconds a worker answers 304 from its ETag cache without asking the DB.
+# Writes in this worker invalidate it at once; writes in other workers are seen after this TTL.
+ETAG_CACHE_TTL = int(os.environ.get("ETAG_CACHE_TTL", "10"))
+# Write-behind: los guardados del wizard se encolan y se escriben en segundo plano.
+# Solo para workers de larga vida (gunicorn); en serverless el proceso se congela entre requests.
+# El guardado pendiente vive en el worker: con varios, cada usuario tiene que ir siempre al mismo.
+SIMULATION_WRITE_BEHIND = os.environ.get("SIMULATION_WRITE_BEHIND", "false").lower() == "true"
+SIMULATION_FLUSH_INTERVAL = float(os.environ.get("SIMULATION_FLUSH_INTERVAL", "2.0")) # Seconds between flushes
+# Escrituras concurrentes y fire-and-forget (write-back del reporte, flush del write-behind).
+# También solo para workers de larga vida, y con la misma limitación por worker; ver gunicorn.conf.py.
+ASYNC_IO = os.environ.get("ASYNC_IO", "false").lower() == "true"
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "32")) # Threads for background Supabase calls
+# Exportación PDF: se renderiza en procesos aparte y se guarda en disco por hash del reporte
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "edooconnect-pdf"))
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "2")) # Render processes per worker; 0 renders in the request thread
+PDF_RENDER_TIMEOUT = float(os.environ.get("PDF_RENDER_TIMEOUT", "30")) # Seconds
+# Webhook de pagos firmado al estilo Stripe (header Stripe-Signature: "t=<unix>,v1=<hmac>").
+# Con ASYNC_IO los eventos se encolan y se aplican en lotes; sin él, en el mismo request.
+PAYMENT_WEBHOOK_SECRET = os.environ.get("PAYMENT_WEBHOOK_SECRET")
+PAYMENT_WEBHOOK_TOLERANCE = int(os.environ.get("PAYMENT_WEBHOOK_TOLERANCE", "300")) # Max age in seconds of a signed timestamp
+WEBHOOK_IDEMPOTENCY_SIZE = int(os.environ.get("WEBHOOK_IDEMPOTENCY_SIZE", "100000"))
+WEBHOOK_IDEMPOTENCY_TTL = int(os.environ.get("WEBHOOK_IDEMPOTENCY_TTL", "259200")) # Covers the provider's 3-day retry window
+WEBHOOK_QUEUE_SIZE = int(os.environ.get("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", "500"))
+WEBHOOK_BATCH_WAIT = float(os.environ.get("WEBHOOK_BATCH_WAIT", "0.5")) # Seconds a batch waits to fill up
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "5"))
+PREMIUM_CACHE_TTL = int(os.environ.get("PREMIUM_CACHE_TTL", "300")) # Updates from other workers are seen after this TTL
+REPORT_CACHE_SIZE = int(os.environ.get("REPORT_CACHE_SIZE", "2048"))
+REPORT_CACHE_TTL = int(os.environ.get("REPORT_CACHE_TTL", "86400"))
+BATCH_MAX_PROFILES = int(os.environ.get("BATCH_MAX_PROFILES", "50000"))
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "2000")) # Profiles computed per streamed chunk
+WHAT_IF_MAX_CELLS = int(os.environ.get("WHAT_IF_MAX_CELLS", "10000"))
+COST_DB_PATH = os.environ.get("COST_DB_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cost_of_living.csv"))
+COST_DB_RELOAD_INTERVAL = float(os.environ.get("COST_DB_RELOAD_INTERVAL", "30")) # Seconds between file change checks
+PROJECTION_MIN_MONTHS = 12
+PROJECTION_MAX_MONTHS = 120
+PART_TIME_HOURLY_RATE = 15 # USD/hora promedio, igual que el motor de Node
+# Riesgo Monte Carlo: supuestos anuales de la simulación
+MONTE_CARLO_PATHS = int(os.environ.get("MONTE_CARLO_PATHS", "10000"))
+MONTE_CARLO_MAX_PATHS = int(os.environ.get("MONTE_CARLO_MAX_PATHS", "50000"))
+MONTE_CARLO_INFLATION_VOL = float(os.environ.get("MONTE_CARLO_INFLATION_VOL", "0.02"))
+MONTE_CARLO_FX_VOL = float(os.environ.get("MONTE_CARLO_FX_VOL", "0.10"))
+MONTE_CARLO_INCOME_LOSS_PROB = float(os.environ.get("MONTE_CARLO_INCOME_LOSS_PROB", "0.05")) # Monthly probability
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
+STATIC_RESCAN_INTERVAL = float(os.environ.get("STATIC_RESCAN_INTERVAL", "10")) # Min seconds between rescans on a manifest miss
+STATIC_MIN_COMPRESS_SIZE = 1024
+# If set, /metrics requires "Authorization: Bearer <token>". Without it, /api/metrics (public on Vercel)
+# and /metrics on Vercel answer 404; plain /metrics stays open for an internal scrape under gunicorn.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+# Cada worker de gunicorn tiene sus propias métricas. Con METRICS_DIR (gunicorn.conf.py lo define
+# si hay varios workers) cada uno publica las suyas ahí y /metrics devuelve las de todos.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get("METRICS_SNAPSHOT_INTERVAL", "5")) # Seconds between snapshots of each worker
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Logs escritos por un thread en segundo plano. En Vercel el proceso se congela al responder
+# y lo encolado podría no salir, así que ahí se escribe directamente.
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "false" if os.environ.get("VERCEL") else "true").lower() == "true"
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0")) # Fraction of access-log lines kept
+# Overrides per route, e.g. "/<path:path>=0.05,/health=0". Errors and slow requests are always logged.
+# The static frontend routes are sampled at 1% by default: one line per asset is mostly noise.
+LOG_ROUTE_SAMPLE_RATES = {
+    '/': 0.01,
+    '/<path:path>': 0.01,
+    **{
+        route.strip(): float(rate)
+        for route, _, rate in (item.rpartition('=') for item in os.environ.get("LOG_ROUTE_SAMPLE_RATES", "").split(',') if '=' in item)
+    }
+}
+LOG_SLOW_REQUEST_MS = float(os.environ.get("LOG_SLOW_REQUEST_MS", "1000"))
+LOG_EXCEPTION_WINDOW = float(os.environ.get("LOG_EXCEPTION_WINDOW", "60")) # Seconds a repeated traceback stays suppressed
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro, con los campos de `extra` y el request en curso"""
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json_dumps(entry)
+
+class RequestContextFilter(logging.Filter):
+    """Agrega request_id y route a los registros emitidos dentro de un request"""
+    def filter(self, record):
+        if has_request_context() and not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id')
+            record.route = request.url_rule.rule if request.url_rule is not None else None
+        return True
+
+class ExceptionRateLimiter(logging.Filter):
+    """Deduplica tracebacks: el mismo error (tipo + línea que lo lanzó) se escribe
+    una vez por LOG_EXCEPTION_WINDOW; las repeticiones se cuentan y se informan
+    en el siguiente registro que pase."""
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self._seen = {}  # clave -> [último registro escrito, repeticiones suprimidas]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not record.exc_info or record.exc_info[0] is None:
+            return True
+        exc_type, _, tb = record.exc_info
+        while tb is not None and tb.tb_next is not None:
+            tb = tb.tb_next
+        key = (exc_type, tb.tb_frame.f_code.co_filename, tb.tb_lineno) if tb is not None else (exc_type,)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen[0] < self.window:
+                seen[1] += 1
+                return False
+            if len(self._seen) > 1000:
+                self._seen.clear()
+            self._seen[key] = [now, 0]
+        if seen is not None and seen[1]:
+            record.suppressed_repeats = seen[1]
+        return True
+
+class _LogQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # El traceback se formatea en el thread del listener, no en el del request
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def _configure_logging():
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    if LOG_ASYNC:
+        handler = _LogQueueHandler(queue.SimpleQueue())
+        listener = logging.handlers.QueueListener(handler.queue, output)
+        listener.start()
+        atexit.register(listener.stop)
+    else:
+        handler = output
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(ExceptionRateLimiter(LOG_EXCEPTION_WINDOW))
+    logger = logging.getLogger('edooconnect')
+    logger.setLevel(LOG_LEVEL)
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    return logger
+
+log = _configure_logging()
+access_log = log.getChild('access')
+
+class TTLCache:
+    """Caché LRU acotada con expiración por entrada (thread-safe)"""
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """Guarda la clave solo si no está (o expiró); devuelve si la guardó"""
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > now:
+                return False
+            self._data[key] = (value, now + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def discard_where(self, predicate):
+        """Elimina las entradas cuyo valor cumple el predicado"""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_QUANTILES = (0.5, 0.95, 0.99)
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """Contador Prometheus por combinación de labels"""
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.help_text}')
+        lines.append(f'# TYPE {self.name} counter')
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+
+class Histogram:
+    """Histograma Prometheus de buckets fijos; también publica p50/p95/p99 estimados.
+
+    observe() es un bisect y tres sumas bajo un lock, barato para dejarlo
+    siempre activo.
+    """
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [conteos por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def quantile(self, counts, total, q):
+        """Cuantil interpolado linealmente dentro del bucket, como histogram_quantile()"""
+        target = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if count and cumulative + count >= target:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (target - cumulative) / count
+            cumulative += count
+        return 0.0
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.help_text}')
+        lines.append(f'# TYPE {self.name} histogram')
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for label_values, counts, total_sum, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = _format_labels(self.labels, label_values, 'le="%s"' % le)
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {total_sum}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {total}')
+        lines.append(f'# HELP {self.name}_quantile Estimated from the histogram buckets')
+        lines.append(f'# TYPE {self.name}_quantile gauge')
+        for label_values, counts, _, total in items:
+            for q in METRIC_QUANTILES:
+                quantile_labels = _format_labels(self.labels, label_values, 'quantile="%s"' % q)
+                lines.append(f'{self.name}_quantile{quantile_labels} {self.quantile(counts, total, q):.6f}')
+
+_request_duration = Histogram('edoo_http_request_duration_seconds', 'Request latency by route', ('method', 'route'))
+_requests_total = Counter('edoo_http_requests_total', 'Requests by route and status', ('method', 'route', 'status'))
+_request_errors = Counter('edoo_http_errors_total', 'Responses with status >= 500', ('method', 'route'))
+_phase_duration = Histogram('edoo_phase_duration_seconds', 'Time spent per phase: auth, db_* (Supabase calls), engine and pdf', ('phase',))
 
-print(f"📁 Base directory: {BASE_DIR}")
-print(f"📁 Static directory: {STATIC_DIR}")
+@contextmanager
+def timed(phase):
+    """Mide una fase (auth, db_select, engine...) para /metrics y el header Server-Timing"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _phase_duration.observe(elapsed, phase)
+        if has_request_context():
+            timings = g.get('timings')
+            if timings is not None:
+                timings[phase] = timings.get(phase, 0.0) + elapsed
+
+# token hash -> {'id', 'email', 'iat'} de tokens ya verificados
+_auth_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+# token hash -> True para tokens revocados (logout) antes de expirar. Best-effort: vive en
+# la memoria de este worker y es un LRU acotado; lo que invalida la sesión es el sign-out en GoTrue
+_revoked_tokens = TTLCache(AUTH_CACHE_SIZE, AUTH_REVOCATION_TTL)
+# user_id -> timestamp; tokens emitidos antes de esa fecha se rechazan
+_revoked_users = TTLCache(AUTH_CACHE_SIZE, AUTH_REVOCATION_TTL)
+_jwks_client = None
+
+def _token_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _unverified_claims(token):
+    try:
+        return jwt.decode(token, options={"verify_signature": False})
+    except jwt.PyJWTError:
+        return {}
+
+def _seconds_until_expiry(claims, default):
+    exp = claims.get('exp')
+    if not exp:
+        return default
+    return max(0, min(default, int(exp - time.time())))
+
+def _get_jwks_client():
+    """Cliente JWKS con caché de claves de firma (tokens RS256/ES256)"""
+    global _jwks_client
+    if _jwks_client is None and SUPABASE_URL:
+        _jwks_client = jwt.PyJWKClient(f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json", cache_keys=True)
+    return _jwks_client
+
+def _verify_token_locally(token):
+    """Verifica firma y expiración del JWT sin llamar a Supabase.
+
+    Devuelve los claims, o None si no hay clave local para verificarlo.
+    Lanza jwt.InvalidTokenError si el token es inválido o expiró.
+    """
+    alg = jwt.get_unverified_header(token).get('alg')
+    if alg == 'HS256':
+        if not SUPABASE_JWT_SECRET:
+            return None
+        key = SUPABASE_JWT_SECRET
+    elif alg in ('RS256', 'ES256'):
+        jwks_client = _get_jwks_client()
+        if jwks_client is None:
+            return None
+        try:
+            key = jwks_client.get_signing_key_from_jwt(token).key
+        except jwt.PyJWKClientError as e:
+            log.warning("JWKS lookup failed, falling back to remote verification", extra={'error': str(e)})
+            return None
+    else:
+        return None
+    return jwt.decode(token, key, algorithms=[alg], audience='authenticated',
+                      options={"require": ["exp", "sub"]})
+
+def _is_revoked(key, user):
+    if _revoked_tokens.get(key):
+        return True
+    revoked_at = _revoked_users.get(user['id'])
+    return revoked_at is not None and (user.get('iat') or 0) <= revoked_at
+
+def authenticate_token(token):
+    """Resuelve un access token a {'id', 'email'} o None si no es válido.
+
+    Usa la caché primero, luego verificación local con PyJWT y solo
+    como último recurso la llamada remota a Supabase.
+    """
+    key = _token_key(token)
+    user = _auth_cache.get(key)
+    if user is None:
+        try:
+            claims = _verify_token_locally(token)
+        except jwt.InvalidTokenError:
+            return None
+        if claims is not None:
+            user = {'id': claims['sub'], 'email': claims.get('email'), 'iat': claims.get('iat')}
+            ttl = _seconds_until_expiry(claims, AUTH_CACHE_TTL)
+        else:
+            # Fallback: no hay secreto/JWKS disponible para verificar localmente
+            with timed('auth_remote'):
+                user_response = get_auth_client().auth.get_user(token)
+            if user_response.user is None:
+                return None
+            claims = _unverified_claims(token)
+            user = {'id': user_response.user.id, 'email': user_response.user.email, 'iat': claims.get('iat')}
+            ttl = _seconds_until_expiry(claims, AUTH_CACHE_TTL)
+        if ttl <= 0:
+            return None
+        _auth_cache.set(key, user, ttl=ttl)
+    if _is_revoked(key, user):
+        return None
+    return user
+
+def revoke_token(token):
+    """Revoca un token concreto en este worker (best-effort; ver _revoked_tokens)"""
+    key = _token_key(token)
+    _auth_cache.pop(key)
+    ttl = _seconds_until_expiry(_unverified_claims(token), AUTH_REVOCATION_TTL)
+    if ttl > 0:
+        _revoked_tokens.set(key, True, ttl=ttl)
+
+def revoke_user(user_id):
+    """Revoca todos los tokens de un usuario emitidos hasta ahora"""
+    _revoked_users.set(user_id, time.time())
+    _auth_cache.discard_where(lambda user: user['id'] == user_id)
 
 def require_auth(f):
     """Decorador para rutas que requieren autenticación"""
@@ -34,43 +592,717 @@ def require_auth(f):
                 return jsonify({"success": False, "message": "Token requerido"}), 401
             
             token = auth_header.split(" ")[1]
-            # Supabase handles JWT verification internally when getting user
-            user_response = supabase.auth.get_user(token)
-            if user_response.user is None:
-                # If user is None, it means the token is invalid or expired
+            with timed('auth'):
+                user = authenticate_token(token)
+            if user is None:
                 return jsonify({"success": False, "message": "Token inválido o expirado"}), 401
             
-            request.user_id = user_response.user.id
+            request.user_id = user['id']
+            request.user_email = user['email']
             request.access_token = token # Store access token for further Supabase calls
             return f(*args, **kwargs)
-        except Exception as e:
-            print(f"Auth error: {e}")
-            traceback.print_exc()
+        except Exception:
+            log.exception("Auth error")
             return jsonify({"success": False, "message": "Error de autenticación"}), 401
     
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+_save_stats = {'requests': 0, 'writes': 0, 'skipped': 0, 'coalesced': 0}
+_save_stats_lock = threading.Lock()
+
+def _count_save(outcome):
+    """Cuenta un guardado con su resultado final: 'writes', 'skipped' o 'coalesced'.
+
+    Con write-behind el resultado se conoce recién al hacer flush; 'coalesced'
+    es un guardado encolado que reemplazó otro más nuevo antes de escribirse.
+    """
+    with _save_stats_lock:
+        _save_stats['requests'] += 1
+        _save_stats[outcome] += 1
+
+def content_hash(data):
+    """Hash canónico (claves ordenadas, sin espacios) de un payload JSON"""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# (user_id, 'simulation' | 'report') -> ETag de la última respuesta servida
+_resource_etags = TTLCache(AUTH_CACHE_SIZE, ETAG_CACHE_TTL)
+
+def resource_etag(*parts):
+    """ETag a partir del contenido tal como está guardado (sin decodificar el JSON)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part if isinstance(part, str) else json.dumps(part, sort_keys=True)).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+def invalidate_etags(user_id):
+    _resource_etags.pop((user_id, 'simulation'))
+    _resource_etags.pop((user_id, 'report'))
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def encode_document(value):
+    """Valor a guardar en wizard_data/report_data según SIMULATION_STORAGE"""
+    return value if SIMULATION_STORAGE == 'jsonb' else json_dumps(value)
+
+def decode_document(value):
+    """Lee wizard_data/report_data tanto de columnas jsonb como de filas de texto antiguas"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        # Filas de texto, o strings JSON que quedaron dentro de jsonb durante la migración
+        return json_loads(value)
+    return value
+
+def upsert_simulation(user_id, wizard_data, wizard_hash=None):
+    """Guarda el wizard del usuario en un solo round trip.
+
+    La base compara con el wizard_hash guardado y no escribe si coincide
+    (migrations/006_save_simulation.sql); devuelve si escribió.
+    """
+    wizard_hash = wizard_hash or content_hash(wizard_data)
+    with timed('db_rpc'):
+        response = get_supabase().rpc('save_simulation', {
+            'p_user_id': user_id,
+            'p_wizard_data': wizard_data,
+            'p_wizard_hash': wizard_hash
+        }).execute()
+    written = response.data is True
+    if written:
+        invalidate_etags(user_id)
+    return written
+
+class SimulationWriteBehind:
+    """Buffer por usuario que agrupa guardados del wizard y los escribe en segundo plano.
+
+    Cada usuario tiene como máximo un guardado pendiente (el último), así que
+    una ráfaga de clics se convierte en una sola escritura por ventana.
+    """
+    def __init__(self, interval, stripes=64):
+        self.interval = interval
+        self._pending = {}  # user_id -> (wizard_data, wizard_hash)
+        self._inflight = {}  # guardados que se están escribiendo ahora mismo
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._stop = threading.Event()
+        self._thread = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='simulation-write-behind', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Detiene el flusher y escribe lo que quede pendiente"""
+        self._stop.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def enqueue(self, user_id, wizard_data, wizard_hash):
+        with self._lock:
+            replaced = user_id in self._pending
+            self._pending[user_id] = (wizard_data, wizard_hash)
+            self.enqueued += 1
+        if replaced:
+            # El guardado anterior ya no se va a escribir: lo absorbe este
+            _count_save('coalesced')
+        self.start()
+
+    def pending(self, user_id):
+        """Último wizard_data aún no escrito del usuario (read-your-writes)"""
+        with self._lock:
+            item = self._pending.get(user_id) or self._inflight.get(user_id)
+        return item[0] if item else None
+
+    def pending_hash(self, user_id):
+        with self._lock:
+            item = self._pending.get(user_id) or self._inflight.get(user_id)
+        return item[1] if item else None
+
+    def flush(self, user_id=None):
+        """Escribe los guardados pendientes (todos o solo los de un usuario)"""
+        if user_id is not None:
+            self._flush_user(user_id)
+            return
+        with self._lock:
+            users = list(self._pending)
+        if ASYNC_IO and len(users) > 1 and not self._stop.is_set():
+            # Un upsert por usuario, en paralelo sobre el pool de conexiones
+            # (al apagar el pool ya no acepta tareas: el último flush es secuencial)
+            wait_futures([get_io_executor().submit(self._flush_user, uid) for uid in users])
+        else:
+            for uid in users:
+                self._flush_user(uid)
+
+    def _flush_user(self, uid):
+        # Lock por usuario (striped): un PATCH o generate que fuerza el flush de su
+        # usuario no espera a que el hilo de fondo termine de escribir a los demás
+        with self._stripes[hash(uid) % len(self._stripes)]:
+            with self._lock:
+                item = self._pending.pop(uid, None)
+                if item is None:
+                    return
+                self._inflight[uid] = item
+            try:
+                self._write(uid, item)
+            finally:
+                with self._lock:
+                    self._inflight.pop(uid, None)
+
+    def _write(self, uid, item):
+        wizard_data, wizard_hash = item
+        try:
+            written = upsert_simulation(uid, wizard_data, wizard_hash)
+            _count_save('writes' if written else 'skipped')
+            with self._lock:
+                self.flushed += 1
+        except Exception:
+            log.exception("Write-behind flush failed", extra={'user_id': uid})
+            with self._lock:
+                self.failed += 1
+                # Reintentar en la próxima ventana salvo que ya haya un guardado más nuevo
+                if uid in self._pending:
+                    _count_save('coalesced')
+                else:
+                    self._pending[uid] = item
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queueDepth': len(self._pending),
+                'enqueued': self.enqueued,
+                'flushed': self.flushed,
+                'failed': self.failed,
+                'coalescingRatio': round(self.enqueued / self.flushed, 2) if self.flushed else None
+            }
+
+_write_behind = SimulationWriteBehind(SIMULATION_FLUSH_INTERVAL) if SIMULATION_WRITE_BEHIND else None
+
+_io_executor = None
+_io_executor_lock = threading.Lock()
+
+def get_io_executor():
+    """Pool de threads para llamadas a Supabase que no bloquean la respuesta"""
+    global _io_executor
+    if _io_executor is None:
+        with _io_executor_lock:
+            if _io_executor is None:
+                # Al salir, el intérprete espera a que el pool termine lo encolado
+                _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='supabase-io')
+    return _io_executor
+
+class BackgroundWriter:
+    """Escrituras fire-and-forget por clave en las que gana siempre la última encolada.
+
+    Una escritura que empieza después de que se encoló otra más nueva para la
+    misma clave se descarta. Las lecturas llaman a wait() para ver su propia escritura.
+    """
+    def __init__(self, stripes=64):
+        self._latest = {}  # key -> (secuencia, future) de la última escritura encolada
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._sequence = itertools.count(1)
+        self.completed = 0
+        self.superseded = 0
+        self.failed = 0
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            sequence = next(self._sequence)
+            future = get_io_executor().submit(self._run, key, sequence, fn, args)
+            self._latest[key] = (sequence, future)
+        return future
+
+    def _run(self, key, sequence, fn, args):
+        with self._stripes[hash(key) % len(self._stripes)]:
+            with self._lock:
+                latest = self._latest.get(key)
+                if latest is None or latest[0] != sequence:
+                    self.superseded += 1
+                    return
+            try:
+                fn(*args)
+                with self._lock:
+                    self.completed += 1
+            except Exception:
+                log.exception("Background write failed", extra={'key': str(key)})
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    if self._latest.get(key, (None,))[0] == sequence:
+                        del self._latest[key]
+
+    def wait(self, key, timeout=None):
+        """Espera a que termine la escritura pendiente de la clave (read-your-writes)"""
+        with self._lock:
+            latest = self._latest.get(key)
+        if latest is not None:
+            wait_futures([latest[1]], timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._latest),
+                'completed': self.completed,
+                'superseded': self.superseded,
+                'failed': self.failed
+            }
+
+_report_writes = BackgroundWriter() if ASYNC_IO else None
+
+def store_report(user_id, report_data, report_hash):
+    """Guarda el reporte generado y su hash de entradas en la simulación del usuario"""
+    with timed('db_update'):
+        get_supabase().table('simulations').update({'report_data': encode_document(report_data), 'report_hash': report_hash, 'status': 'completed'}).eq('user_id', user_id).execute()
+    invalidate_etags(user_id)
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+_pdf_pool_unavailable = False
+# clave -> Future del render en curso, para que descargas simultáneas rendericen una sola vez
+_pdf_renders = {}
+_pdf_renders_lock = threading.Lock()
+_pdf_exports = Counter('edoo_pdf_exports_total', 'PDF exports by cache outcome', ('result',))
+
+def get_pdf_pool():
+    """Pool de procesos para renderizar PDFs; None si el entorno no permite crear procesos (Vercel)"""
+    global _pdf_pool, _pdf_pool_unavailable
+    if _pdf_pool is None and not _pdf_pool_unavailable and PDF_WORKERS > 0:
+        with _pdf_pool_lock:
+            if _pdf_pool is None and not _pdf_pool_unavailable:
+                try:
+                    import multiprocessing
+                    # spawn: un fork de este proceso heredaría los locks de los threads de I/O y logging
+                    _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+                except (OSError, NotImplementedError):
+                    log.warning("Process pool unavailable, rendering PDFs in the request thread", exc_info=True)
+                    _pdf_pool_unavailable = True
+    return _pdf_pool
+
+def _discard_pdf_pool(pool):
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+def pdf_cache_key(report_etag):
+    return f'{pdf_report.RENDERER_VERSION}-{report_etag}'
+
+def pdf_cache_path(key):
+    return os.path.join(PDF_CACHE_DIR, f'{key}.pdf')
+
+def _prune_pdf_cache():
+    """Borra los PDFs usados hace más tiempo hasta quedar bajo PDF_CACHE_MAX_BYTES"""
+    entries = []
+    with os.scandir(PDF_CACHE_DIR) as scan:
+        for entry in scan:
+            if entry.name.endswith('.pdf'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= PDF_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def _render_pdf(raw_report, path):
+    pool = get_pdf_pool()
+    if pool is not None:
+        try:
+            # El reporte viaja tal como está guardado: el JSON se decodifica en el proceso hijo
+            return pool.submit(pdf_report.render_report_pdf, raw_report, path).result(timeout=PDF_RENDER_TIMEOUT)
+        except BrokenProcessPool:
+            log.warning("PDF process pool broken, rendering in the request thread")
+            _discard_pdf_pool(pool)
+    return pdf_report.render_report_pdf(raw_report, path)
+
+def render_pdf_cached(key, raw_report):
+    """Ruta del PDF para la clave; lo renderiza solo si no está en disco ni en curso"""
+    path = pdf_cache_path(key)
+    if os.path.exists(path):
+        _pdf_exports.inc('hit')
+        return path
+    with _pdf_renders_lock:
+        future = _pdf_renders.get(key)
+        owner = future is None
+        if owner:
+            future = _pdf_renders[key] = Future()
+    if not owner:
+        return future.result(timeout=PDF_RENDER_TIMEOUT)
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        with timed('pdf'):
+            _render_pdf(raw_report, path)
+        _pdf_exports.inc('rendered')
+        _prune_pdf_cache()
+        future.set_result(path)
+    except Exception as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with _pdf_renders_lock:
+            _pdf_renders.pop(key, None)
+    return path
+
+def send_pdf(key):
+    """Respuesta con el PDF en disco, enviada por bloques (wsgi.file_wrapper / sendfile)"""
+    path = pdf_cache_path(key)
+    response = send_file(path, mimetype='application/pdf', as_attachment=True, download_name='edooconnect-analisis.pdf',
+                         etag=key, conditional=True, max_age=0)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    # Marca el archivo como usado recientemente para _prune_pdf_cache
+    os.utime(path)
+    return response
+
+# user_id -> is_premium, para no leer profiles en cada request
+_premium_cache = TTLCache(AUTH_CACHE_SIZE, PREMIUM_CACHE_TTL)
+# event id -> True de los eventos de pago ya recibidos (los proveedores reintentan y duplican entregas)
+_webhook_event_ids = TTLCache(WEBHOOK_IDEMPOTENCY_SIZE, WEBHOOK_IDEMPOTENCY_TTL)
+_webhook_events = Counter('edoo_webhook_events_total', 'Payment webhook events by outcome', ('result',))
+
+def get_premium_status(user_id):
+    """Flag premium del usuario desde profiles, cacheado PREMIUM_CACHE_TTL segundos"""
+    cached = _premium_cache.get(user_id)
+    if cached is not None:
+        return cached
+    with timed('db_select'):
+        response = get_supabase().table('profiles').select('is_premium').eq('id', user_id).limit(1).execute()
+    is_premium = bool(response.data and response.data[0].get('is_premium'))
+    _premium_cache.set(user_id, is_premium)
+    return is_premium
+
+def verify_webhook_signature(payload, header, secret, tolerance=PAYMENT_WEBHOOK_TOLERANCE):
+    """HMAC-SHA256 de "<t>.<body>" contra las firmas v1 del header, como Stripe"""
+    timestamp, signatures = None, []
+    for item in (header or '').split(','):
+        name, _, value = item.strip().partition('=')
+        if name == 't':
+            timestamp = value
+        elif name == 'v1':
+            signatures.append(value)
+    if not timestamp or not timestamp.isascii() or not signatures:
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance:
+            return False
+    except ValueError:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), timestamp.encode('ascii') + b'.' + payload, hashlib.sha256).hexdigest().encode('ascii')
+    # En bytes: compare_digest lanza TypeError con un str no ASCII, y el header lo controla el cliente
+    return any(hmac.compare_digest(expected, signature.encode('latin-1', 'replace')) for signature in signatures)
+
+PREMIUM_SUBSCRIPTION_STATUSES = ('active', 'trialing')
+
+def premium_update_from_event(event):
+    """(user_id, is_premium, created) que implica el evento, o None si no cambia el plan"""
+    event_type = event.get('type')
+    obj = (event.get('data') or {}).get('object') or {}
+    user_id = obj.get('client_reference_id') or (obj.get('metadata') or {}).get('user_id')
+    if not user_id:
+        return None
+    if event_type == 'checkout.session.completed':
+        if obj.get('payment_status') not in ('paid', 'no_payment_required'):
+            return None
+        is_premium = True
+    elif event_type in ('customer.subscription.created', 'customer.subscription.updated'):
+        is_premium = obj.get('status') in PREMIUM_SUBSCRIPTION_STATUSES
+    elif event_type == 'customer.subscription.deleted':
+        is_premium = False
+    else:
+        return None
+    return user_id, is_premium, event.get('created') or int(time.time())
+
+def apply_premium_updates(updates):
+    """Escribe el último estado de cada usuario del lote en un solo round trip.
+
+    La base no pisa una fila con un evento más viejo que el que la escribió
+    (migrations/007_apply_premium_updates.sql); devuelve cuántas filas cambió.
+    """
+    latest = {}
+    for user_id, is_premium, created in sorted(updates, key=lambda update: update[2]):
+        latest[user_id] = (is_premium, created)
+    rows = [
+        {'id': user_id, 'is_premium': is_premium,
+         'premium_updated_at': datetime.fromtimestamp(created, timezone.utc).isoformat()}
+        for user_id, (is_premium, created) in latest.items()
+    ]
+    with timed('db_rpc'):
+        response = get_supabase().rpc('apply_premium_updates', {'p_updates': rows}).execute()
+    applied = {row['user_id'] for row in response.data or []}
+    for user_id, (is_premium, _) in latest.items():
+        if user_id in applied:
+            _premium_cache.set(user_id, is_premium)
+        else:
+            # Evento viejo: la fila ya tiene uno más nuevo, que se lee de la base
+            _premium_cache.pop(user_id)
+    return len(applied)
+
+class PaymentEventProcessor:
+    """Cola acotada de eventos de pago ya verificados que un thread aplica en lotes.
+
+    El webhook solo encola y responde; el thread junta hasta WEBHOOK_BATCH_SIZE
+    eventos (o los que lleguen en WEBHOOK_BATCH_WAIT segundos) por upsert, así
+    una ráfaga del proveedor no ocupa los workers de la API.
+    """
+    def __init__(self, batch_size, batch_wait, maxsize):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.batches = 0
+        self.applied = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='payment-events', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Deja de esperar eventos nuevos y aplica lo que quede en la cola"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def enqueue(self, event_id, update):
+        """False si la cola está llena: el webhook responde 503 y el proveedor reintenta"""
+        try:
+            self._queue.put_nowait((event_id, update))
+        except queue.Full:
+            return False
+        self.start()
+        return True
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._apply(batch)
+
+    def _apply(self, batch):
+        for attempt in range(1, WEBHOOK_MAX_ATTEMPTS + 1):
+            try:
+                apply_premium_updates([update for _, update in batch])
+                with self._lock:
+                    self.batches += 1
+                    self.applied += len(batch)
+                return
+            except Exception:
+                if attempt == WEBHOOK_MAX_ATTEMPTS or self._stop.is_set():
+                    break
+                log.warning("Premium update batch failed, retrying", extra={'events': len(batch), 'attempt': attempt}, exc_info=True)
+                self._stop.wait(min(2 ** attempt, 30))
+        # Último intento de a uno: una fila inválida no descarta el lote entero
+        for event_id, update in batch:
+            try:
+                apply_premium_updates([update])
+                with self._lock:
+                    self.applied += 1
+            except Exception:
+                # El proveedor ya recibió el 200: sin la marca de recibido, reenviar
+                # el evento (desde el proveedor) lo vuelve a aplicar en vez de descartarlo
+                _webhook_event_ids.pop(event_id)
+                _webhook_events.inc('dropped')
+                log.exception("Premium update dropped", extra={'user_id': update[0], 'event_id': event_id})
+                with self._lock:
+                    self.failed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queueDepth': self._queue.qsize(),
+                'batches': self.batches,
+                'applied': self.applied,
+                'failed': self.failed
+            }
+
+_payment_events = PaymentEventProcessor(WEBHOOK_BATCH_SIZE, WEBHOOK_BATCH_WAIT, WEBHOOK_QUEUE_SIZE) if ASYNC_IO else None
+
+FAMILY_MULTIPLIERS = {'couple': 1.7, 'family': 2.3}
+COST_FIELDS = ('tuition', 'housing', 'food', 'transport', 'insurance', 'misc')
+
+def _location_key(value):
+    return value.strip().lower() if isinstance(value, str) else ''
+
+class CostDatabase:
+    """Costos por país/estado/ciudad cargados una sola vez en una tabla NumPy.
+
+    Cada fila del CSV es una ubicación; estado y/o ciudad vacíos indican el
+    promedio del nivel superior. El índice resuelve en O(1) con la jerarquía
+    ciudad -> estado -> país -> país por defecto.
+    """
+    DEFAULT_COUNTRY = 'canada'
+
+    def __init__(self, path):
+        import numpy as np
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        self.version = hashlib.sha256(raw).hexdigest()
+        index = {}
+        city_index = {}  # (país, ciudad) para cuando el wizard no trae el estado
+        rows = []
+        for record in csv.DictReader(io.StringIO(raw.decode('utf-8'))):
+            country, state, city = (_location_key(record[column]) for column in ('country', 'state', 'city'))
+            index[(country, state, city)] = len(rows)
+            if city:
+                city_index.setdefault((country, city), len(rows))
+            rows.append([int(record[field]) for field in COST_FIELDS])
+        self.table = np.array(rows, dtype=np.int32)
+        self.index = index
+        self.city_index = city_index
+        self.default_row = index[(self.DEFAULT_COUNTRY, '', '')]
+
+    def resolve(self, country, state=None, city=None):
+        """Fila de la ubicación más específica disponible"""
+        country, state, city = _location_key(country), _location_key(state), _location_key(city)
+        row = self.index.get((country, state, city))
+        if row is None and city:
+            row = self.city_index.get((country, city))
+        if row is None:
+            row = self.index.get((country, state, ''))
+        if row is None:
+            row = self.index.get((country, '', ''), self.default_row)
+        return row
+
+    def costs(self, row):
+        return dict(zip(COST_FIELDS, self.table[row].tolist()))
+
+_cost_db = None
+_cost_db_checked_at = 0.0
+_cost_db_lock = threading.Lock()
+
+def get_cost_db():
+    """Base de costos vigente; se recarga sin reiniciar si el archivo cambió"""
+    global _cost_db, _cost_db_checked_at
+    now = time.time()
+    if _cost_db is not None and now - _cost_db_checked_at < COST_DB_RELOAD_INTERVAL:
+        return _cost_db
+    with _cost_db_lock:
+        if _cost_db is None or now - _cost_db_checked_at >= COST_DB_RELOAD_INTERVAL:
+            _cost_db_checked_at = now
+            try:
+                if _cost_db is None or os.path.getmtime(COST_DB_PATH) != _cost_db.mtime:
+                    _cost_db = CostDatabase(COST_DB_PATH)
+            except (OSError, ValueError, KeyError) as e:
+                if _cost_db is None:
+                    raise
+                log.warning("Cost database reload failed, keeping current version", extra={'version': _cost_db.version[:12], 'error': str(e)})
+    return _cost_db
+
+BASIC_RECOMMENDATIONS = [
+    {
+        'title': 'Optimizar costos de vivienda',
+        'description': 'Busca opciones de vivienda compartida para reducir gastos.',
+        'category': 'cost_optimization',
+        'priority': 1
+    },
+    {
+        'title': 'Explorar becas y ayudas',
+        'description': 'Investiga becas disponibles para estudiantes internacionales.',
+        'category': 'funding',
+        'priority': 2
+    },
+    {
+        'title': 'Trabajo de medio tiempo',
+        'description': 'Considera trabajar medio tiempo para generar ingresos adicionales.',
+        'category': 'income_generation',
+        'priority': 3
+    }
+]
+
+# Incrementar cuando cambie la lógica de calculate_financial_analysis o de la proyección
+REPORT_ENGINE_VERSION = 3
+# Campos del wizard que lee el motor; el resto no afecta al reporte
+REPORT_INPUT_FIELDS = (
+    ('step3', 'familyStatus'),
+    ('step5', 'currentSavings'),
+    ('step5', 'monthlyIncome'),
+    ('step5', 'workHours'),
+    ('step6', 'country'),
+    ('step7', 'state'),
+    ('step7', 'city'),
+)
+REPORT_INPUT_STEPS = tuple(sorted({step for step, _ in REPORT_INPUT_FIELDS}))
+
+# report_hash -> reporte ya calculado (compartido entre usuarios con las mismas entradas)
+_report_cache = TTLCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL)
+
+def report_cache_key(wizard_data, options=None):
+    """Hash canónico de las entradas del motor, las opciones del reporte y las tablas de costos.
+
+    Cambiar la base de costos o REPORT_ENGINE_VERSION invalida todos los reportes.
+    """
+    inputs = {f'{step}.{field}': (wizard_data.get(step) or {}).get(field) for step, field in REPORT_INPUT_FIELDS}
+    return content_hash({'engine': REPORT_ENGINE_VERSION, 'costs': get_cost_db().version, 'inputs': inputs, 'options': options or {}})
+
+def family_multiplier_for(family_status):
+    """Factor de ajuste de gastos de vida por situación familiar"""
+    if isinstance(family_status, str):
+        return FAMILY_MULTIPLIERS.get(family_status, 1.0)
+    return 1.0
+
 # Motor financiero simplificado (assuming it doesn't need direct DB access)
 def calculate_financial_analysis(wizard_data):
     """Calcular análisis financiero"""
     try:
-        # Datos base por país
-        cost_data = {
-            'canada': {'tuition': 25000, 'housing': 1200, 'food': 450, 'transport': 120, 'insurance': 100, 'misc': 350},
-            'usa': {'tuition': 35000, 'housing': 1800, 'food': 600, 'transport': 180, 'insurance': 200, 'misc': 450}
-        }
-        
         country = wizard_data.get('step6', {}).get('country', 'canada').lower()
-        costs = cost_data.get(country, cost_data['canada'])
+        location = wizard_data.get('step7', {})
+        cost_db = get_cost_db()
+        costs = cost_db.costs(cost_db.resolve(country, location.get('state'), location.get('city')))
         
         # Factor de ajuste por familia
-        family_multiplier = 1.0
         family_status = wizard_data.get('step3', {}).get('familyStatus', 'single')
-        if family_status == 'couple':
-            family_multiplier = 1.7
-        elif family_status == 'family':
-            family_multiplier = 2.3
+        family_multiplier = family_multiplier_for(family_status)
         
         # Calcular costos
         adjusted_costs = {
@@ -98,26 +1330,7 @@ def calculate_financial_analysis(wizard_data):
             risk_score = 55
         
         # Recomendaciones
-        recommendations = [
-            {
-                'title': 'Optimizar costos de vivienda',
-                'description': 'Busca opciones de vivienda compartida para reducir gastos.',
-                'category': 'cost_optimization',
-                'priority': 1
-            },
-            {
-                'title': 'Explorar becas y ayudas',
-                'description': 'Investiga becas disponibles para estudiantes internacionales.',
-                'category': 'funding',
-                'priority': 2
-            },
-            {
-                'title': 'Trabajo de medio tiempo',
-                'description': 'Considera trabajar medio tiempo para generar ingresos adicionales.',
-                'category': 'income_generation',
-                'priority': 3
-            }
-        ]
+        recommendations = [dict(recommendation) for recommendation in BASIC_RECOMMENDATIONS]
         
         return {
             'costs': {
@@ -141,11 +1354,565 @@ def calculate_financial_analysis(wizard_data):
                 'location': f"{wizard_data.get('step7', {}).get('city', 'Toronto')}, {country.title()}"
             }
         }
-    except Exception as e:
-        print(f"Financial analysis error: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Financial analysis error")
         return None
 
+# Índice devuelto por _analysis_columns -> (riskLevel, riskScore) de calculate_financial_analysis
+RISK_LEVELS = (('low', 85), ('medium', 55), ('high', 25))
+
+def _analysis_columns(cost_table, cost_rows, multipliers, savings):
+    """Aritmética de calculate_financial_analysis sobre columnas NumPy"""
+    import numpy as np
+    base = cost_table[cost_rows].astype(np.int64)
+    tuition = base[:, 0]
+    # int() de Python trunca hacia cero; los costos son positivos
+    living = np.trunc(base[:, 1:] * multipliers[:, None]).astype(np.int64)
+    monthly_total = living.sum(axis=1)
+    yearly_total = tuition + monthly_total * 12
+    risk = np.where(savings < yearly_total * 0.2, 2, np.where(savings < yearly_total * 0.5, 1, 0))
+    return tuition, living, monthly_total, yearly_total, risk
+
+def calculate_financial_analysis_batch(wizard_list):
+    """Versión vectorizada de calculate_financial_analysis para muchos perfiles.
+
+    Devuelve una lista con el mismo resultado que la función escalar para
+    cada perfil (None si el perfil es inválido). La aritmética se hace por
+    columnas con NumPy; solo la lectura de entradas y el armado de la
+    respuesta recorren los perfiles.
+    """
+    import numpy as np
+    n = len(wizard_list)
+    cost_db = get_cost_db()
+    cost_rows = np.zeros(n, dtype=np.intp)
+    multipliers = np.ones(n)
+    savings = np.zeros(n, dtype=np.int64)
+    countries = [None] * n
+    cities = [None] * n
+    fallback = []
+
+    for i, wizard_data in enumerate(wizard_list):
+        try:
+            country = wizard_data.get('step6', {}).get('country', 'canada').lower()
+            family_status = wizard_data.get('step3', {}).get('familyStatus', 'single')
+            row_savings = int(wizard_data.get('step5', {}).get('currentSavings', 0))
+            location = wizard_data.get('step7', {})
+            state, city = location.get('state'), location.get('city', 'Toronto')
+            cost_row = cost_db.resolve(country, state, location.get('city'))
+        except Exception:
+            continue
+        if abs(row_savings) >= 2 ** 53:
+            # Fuera del rango exacto de float64: se calcula con la versión escalar
+            fallback.append(i)
+            continue
+        cost_rows[i] = cost_row
+        multipliers[i] = family_multiplier_for(family_status)
+        savings[i] = row_savings
+        countries[i] = country
+        cities[i] = city
+
+    tuition, living, monthly_total, yearly_total, risk = _analysis_columns(cost_db.table, cost_rows, multipliers, savings)
+    generated_at = datetime.utcnow().isoformat()
+    tuition, living, monthly_total, yearly_total, risk = tuition.tolist(), living.tolist(), monthly_total.tolist(), yearly_total.tolist(), risk.tolist()
+
+    results = [None] * n
+    for i in range(n):
+        if countries[i] is None:
+            continue
+        housing, food, transport, insurance, misc = living[i]
+        monthly = monthly_total[i]
+        risk_level, risk_score = RISK_LEVELS[risk[i]]
+        results[i] = {
+            'costs': {
+                'breakdown': {
+                    'tuition': tuition[i],
+                    'housing': housing,
+                    'food': food,
+                    'transport': transport,
+                    'insurance': insurance,
+                    'miscellaneous': misc
+                },
+                'totals': {
+                    'monthly': monthly,
+                    'yearly': yearly_total[i],
+                    'tuitionOnly': tuition[i],
+                    'livingExpenses': monthly * 12
+                }
+            },
+            'summary': {
+                'monthlyExpenses': monthly,
+                'yearlyTotal': yearly_total[i],
+                'riskLevel': risk_level,
+                'riskScore': risk_score
+            },
+            'basicRecommendations': [dict(recommendation) for recommendation in BASIC_RECOMMENDATIONS],
+            'metadata': {
+                'generatedAt': generated_at,
+                'location': f"{cities[i]}, {countries[i].title()}"
+            }
+        }
+    for i in fallback:
+        results[i] = calculate_financial_analysis(wizard_list[i])
+    return results
+
+def _what_if_savings(value):
+    savings = int(value)
+    if abs(savings) >= 2 ** 53:
+        raise ValueError('savings out of range')
+    return savings
+
+# Ejes de ubicación: se combinan entre sí para resolver la fila de costos
+WHAT_IF_LOCATION_AXES = ('step6.country', 'step7.state', 'step7.city')
+# Resto de ejes: campo del wizard -> (columna del motor, conversión de cada valor)
+WHAT_IF_AXES = {
+    'step3.familyStatus': ('multipliers', family_multiplier_for),
+    'step5.currentSavings': ('savings', _what_if_savings),
+}
+WHAT_IF_FIELDS = WHAT_IF_LOCATION_AXES + tuple(WHAT_IF_AXES)
+
+def evaluate_what_if_grid(base, axes):
+    """Evalúa el producto cartesiano de los ejes sobre un wizard base.
+
+    `axes` es una lista de (campo, valores). Todas las combinaciones se
+    calculan en una sola pasada vectorizada de _analysis_columns, sin armar
+    un wizard por celda. Devuelve las métricas aplanadas en orden row-major.
+    """
+    import numpy as np
+    cost_db = get_cost_db()
+    base_location = base.get('step7', {})
+    location = [
+        base.get('step6', {}).get('country', 'canada').lower(),
+        base_location.get('state'),
+        base_location.get('city')
+    ]
+    base_columns = {
+        'multipliers': family_multiplier_for(base.get('step3', {}).get('familyStatus', 'single')),
+        'savings': _what_if_savings(base.get('step5', {}).get('currentSavings', 0))
+    }
+    dtypes = {'multipliers': float, 'savings': np.int64}
+
+    shape = tuple(len(values) for _, values in axes)
+    cells = int(np.prod(shape))
+    # Índice de cada celda a lo largo de cada eje
+    positions = np.indices(shape).reshape(len(shape), cells)
+    columns = {name: np.full(cells, value, dtype=dtypes[name]) for name, value in base_columns.items()}
+    location_axes = []
+    for axis, (field, values) in enumerate(axes):
+        if field in WHAT_IF_LOCATION_AXES:
+            location_axes.append((axis, WHAT_IF_LOCATION_AXES.index(field), values))
+            continue
+        column, convert = WHAT_IF_AXES[field]
+        axis_values = np.array([convert(value) for value in values], dtype=dtypes[column])
+        columns[column] = axis_values[positions[axis]]
+
+    # Solo se resuelven las combinaciones de ubicación distintas, no cada celda
+    location_rows = np.empty(tuple(len(values) for _, _, values in location_axes), dtype=np.intp)
+    for combination in np.ndindex(*location_rows.shape):
+        cell_location = list(location)
+        for (_, slot, values), value_index in zip(location_axes, combination):
+            cell_location[slot] = values[value_index]
+        location_rows[combination] = cost_db.resolve(*cell_location)
+    cost_rows = location_rows[tuple(positions[axis] for axis, _, _ in location_axes)]
+    if not location_axes:
+        cost_rows = np.full(cells, cost_rows, dtype=np.intp)
+
+    tuition, living, monthly_total, yearly_total, risk = _analysis_columns(
+        cost_db.table, cost_rows, columns['multipliers'], columns['savings']
+    )
+    return {
+        'axes': [{'field': field, 'values': values} for field, values in axes],
+        'shape': list(shape),
+        'order': 'row-major',
+        'metrics': {
+            'tuition': tuition.tolist(),
+            'monthlyExpenses': monthly_total.tolist(),
+            'yearlyTotal': yearly_total.tolist(),
+            'riskLevel': [RISK_LEVELS[r][0] for r in risk.tolist()],
+            'riskScore': [RISK_LEVELS[r][1] for r in risk.tolist()]
+        }
+    }
+
+TUITION_SCHEDULES = ('upfront', 'annual', 'semester', 'monthly')
+
+def _to_number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def parse_projection_options(raw):
+    """Valida las opciones de proyección enviadas por el cliente.
+
+    Devuelve (opciones, mensaje_de_error).
+    """
+    raw = raw or {}
+    if not isinstance(raw, dict):
+        return None, 'Opciones de proyección inválidas'
+    months = raw.get('months', 24)
+    if not isinstance(months, int) or not PROJECTION_MIN_MONTHS <= months <= PROJECTION_MAX_MONTHS:
+        return None, f'El horizonte debe estar entre {PROJECTION_MIN_MONTHS} y {PROJECTION_MAX_MONTHS} meses'
+    inflation = raw.get('inflation', 0.0)
+    if not isinstance(inflation, (int, float)) or not -0.5 < inflation < 1:
+        return None, 'Inflación anual inválida'
+    tuition_schedule = raw.get('tuitionSchedule', 'upfront')
+    if tuition_schedule not in TUITION_SCHEDULES:
+        return None, f'Calendario de matrícula inválido (opciones: {", ".join(TUITION_SCHEDULES)})'
+    return {
+        'months': months,
+        'inflation': float(inflation),
+        'tuitionSchedule': tuition_schedule,
+        'compact': bool(raw.get('compact', False))
+    }, None
+
+def _cash_flow_base(analysis, wizard_data, months, tuition_schedule):
+    """Series base (sin inflación) compartidas por la proyección y el Monte Carlo"""
+    import numpy as np
+    step5 = wizard_data.get('step5') or {}
+    savings = _to_number(step5.get('currentSavings'))
+    work_hours = _to_number(step5.get('workHours'))
+    part_time_income = work_hours * PART_TIME_HOURLY_RATE * 4 if work_hours > 0 else 0
+    monthly_inflows = _to_number(step5.get('monthlyIncome')) + part_time_income
+
+    totals = analysis['costs']['totals']
+    month = np.arange(1, months + 1)
+    tuition = totals['tuitionOnly']
+    if tuition_schedule == 'upfront':
+        tuition_payment = np.where(month == 1, tuition, 0.0)
+    elif tuition_schedule == 'annual':
+        tuition_payment = np.where((month - 1) % 12 == 0, tuition, 0.0)
+    elif tuition_schedule == 'semester':
+        tuition_payment = np.where((month - 1) % 6 == 0, tuition / 2, 0.0)
+    else:
+        tuition_payment = np.full(months, tuition / 12)
+    return month, savings, monthly_inflows, totals['monthly'], tuition_payment
+
+def generate_cash_flow_projection(analysis, wizard_data, months=24, inflation=0.0, tuition_schedule='upfront', compact=False):
+    """Proyección mensual del flujo de caja.
+
+    Equivalente a generateCashFlowProjection del motor de Node ('upfront'
+    cobra la matrícula solo el primer mes), con horizonte de 12 a 120 meses,
+    calendario de matrícula e inflación anual sobre los gastos. Toda la serie
+    se calcula con operaciones de arrays; con compact=True la proyección se
+    devuelve por columnas en lugar de una lista de meses.
+    """
+    import numpy as np
+    month, savings, monthly_inflows, living, tuition_payment = _cash_flow_base(analysis, wizard_data, months, tuition_schedule)
+    # La inflación se aplica por año de estudio: meses 1-12 año 0, 13-24 año 1, ...
+    growth = (1 + inflation) ** ((month - 1) // 12)
+    tuition_payment = tuition_payment * growth
+
+    income = np.full(months, monthly_inflows, dtype=float)
+    expenses = living * growth + tuition_payment
+    net_flow = income - expenses
+    balance = savings + np.cumsum(net_flow)
+    deficit = balance < 0
+
+    columns = {
+        'month': month.tolist(),
+        'income': np.round(income, 2).tolist(),
+        'expenses': np.round(expenses, 2).tolist(),
+        'netFlow': np.round(net_flow, 2).tolist(),
+        'cumulativeBalance': np.round(balance, 2).tolist(),
+        'tuitionPayment': np.round(tuition_payment, 2).tolist(),
+        'isDeficit': deficit.tolist()
+    }
+    if compact:
+        projection = {'format': 'columnar', 'columns': columns}
+    else:
+        names = list(columns)
+        projection = [dict(zip(names, row)) for row in zip(*columns.values())]
+
+    return {
+        'projection': projection,
+        'summary': {
+            'months': months,
+            'inflation': inflation,
+            'tuitionSchedule': tuition_schedule,
+            'totalIncome': round(float(income.sum()), 2),
+            'totalExpenses': round(float(expenses.sum()), 2),
+            'finalBalance': round(float(balance[-1]), 2),
+            'monthsInDeficit': int(deficit.sum()),
+            'firstDeficitMonth': int(month[deficit][0]) if deficit.any() else None,
+            'maxDeficit': round(float(balance.min()), 2)
+        }
+    }
+
+RISK_MODES = ('threshold', 'monte_carlo')
+
+def parse_risk_options(raw):
+    """Valida las opciones de riesgo enviadas por el cliente.
+
+    Devuelve (opciones, mensaje_de_error).
+    """
+    raw = raw or {}
+    if not isinstance(raw, dict):
+        return None, 'Opciones de riesgo inválidas'
+    mode = raw.get('mode', 'threshold')
+    if mode not in RISK_MODES:
+        return None, f'Modo de riesgo inválido (opciones: {", ".join(RISK_MODES)})'
+    paths = raw.get('paths', MONTE_CARLO_PATHS)
+    if not isinstance(paths, int) or not 100 <= paths <= MONTE_CARLO_MAX_PATHS:
+        return None, f'El número de trayectorias debe estar entre 100 y {MONTE_CARLO_MAX_PATHS}'
+    seed = raw.get('seed')
+    if seed is not None and (not isinstance(seed, int) or seed < 0):
+        return None, 'Semilla inválida'
+    return {'mode': mode, 'paths': paths, 'seed': seed}, None
+
+def simulate_risk_monte_carlo(analysis, wizard_data, months=24, tuition_schedule='upfront', inflation=0.0,
+                              paths=MONTE_CARLO_PATHS, seed=None):
+    """Riesgo estocástico: probabilidad de agotar los ahorros durante los estudios.
+
+    Simula `paths` trayectorias mensuales con inflación de costos y tipo de
+    cambio aleatorios (paseo log-normal) y pérdidas de ingreso, todas a la
+    vez como matrices (paths x months). Con la misma semilla el resultado es
+    idéntico, por lo que se puede cachear junto al reporte.
+    """
+    import numpy as np
+    month, savings, monthly_inflows, living, tuition_payment = _cash_flow_base(analysis, wizard_data, months, tuition_schedule)
+    rng = np.random.default_rng(seed)
+
+    # Inflación de costos y tipo de cambio son independientes: su suma es una sola normal
+    monthly_drift = np.log1p(inflation) / 12
+    monthly_vol = np.sqrt(MONTE_CARLO_INFLATION_VOL ** 2 + MONTE_CARLO_FX_VOL ** 2) / np.sqrt(12)
+    # float32 basta para saldos en USD y reduce a la mitad el costo de memoria y tiempo
+    log_growth = rng.standard_normal((paths, months), dtype=np.float32)
+    log_growth *= monthly_vol
+    log_growth += monthly_drift
+    np.cumsum(log_growth, axis=1, out=log_growth)
+    cash_flow = np.exp(log_growth, out=log_growth)
+    cash_flow *= -(living + tuition_payment).astype(np.float32)
+    cash_flow += (rng.random((paths, months), dtype=np.float32) >= MONTE_CARLO_INCOME_LOSS_PROB) * np.float32(monthly_inflows)
+    balance = np.cumsum(cash_flow, axis=1, out=cash_flow)
+    balance += savings
+
+    in_deficit = balance < 0
+    shortfall = in_deficit.any(axis=1)
+    probability = float(shortfall.mean())
+    first_shortfall = in_deficit.argmax(axis=1)[shortfall] + 1
+    p5, p25, p50, p75, p95 = np.percentile(balance[:, -1], [5, 25, 50, 75, 95]).tolist()
+
+    if probability < 0.1:
+        risk_level = 'low'
+    elif probability < 0.4:
+        risk_level = 'medium'
+    else:
+        risk_level = 'high'
+
+    return {
+        'mode': 'monte_carlo',
+        'paths': paths,
+        'months': months,
+        'seed': seed,
+        'probabilityOfShortfall': round(probability, 4),
+        'medianShortfallMonth': int(np.median(first_shortfall)) if first_shortfall.size else None,
+        'finalBalancePercentiles': {
+            'p5': round(p5, 2),
+            'p25': round(p25, 2),
+            'p50': round(p50, 2),
+            'p75': round(p75, 2),
+            'p95': round(p95, 2)
+        },
+        'riskLevel': risk_level,
+        'riskScore': int(round(100 * (1 - probability)))
+    }
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.timings = {}
+    # Se respeta el ID que ponga un proxy para poder correlacionar logs
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    if _metrics_snapshots is not None:
+        _metrics_snapshots.start()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    _request_duration.observe(elapsed, request.method, route)
+    _requests_total.inc(request.method, route, response.status_code)
+    if response.status_code >= 500:
+        _request_errors.inc(request.method, route)
+    # Server-Timing: el navegador muestra el desglose en la pestaña Network
+    phases = [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in g.timings.items()]
+    phases.append(f'total;dur={elapsed * 1000:.1f}')
+    response.headers['Server-Timing'] = ', '.join(phases)
+    response.headers['X-Request-ID'] = g.request_id
+
+    duration_ms = elapsed * 1000
+    if (response.status_code >= 500 or duration_ms >= LOG_SLOW_REQUEST_MS
+            or random.random() < LOG_ROUTE_SAMPLE_RATES.get(route, LOG_SAMPLE_RATE)):
+        access_log.log(logging.WARNING if response.status_code >= 500 else logging.INFO, 'request', extra={
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'timings_ms': {phase: round(seconds * 1000, 2) for phase, seconds in g.timings.items()}
+        })
+    return response
+
+def _render_metrics():
+    lines = []
+    for metric in (_request_duration, _requests_total, _request_errors, _phase_duration, _pdf_exports, _webhook_events):
+        metric.render(lines)
+
+    caches = {'auth': _auth_cache, 'etag': _resource_etags, 'report': _report_cache, 'premium': _premium_cache}
+    for name, help_text in (('hits', 'Cache hits'), ('misses', 'Cache misses')):
+        lines.append(f'# HELP edoo_cache_{name}_total {help_text}')
+        lines.append(f'# TYPE edoo_cache_{name}_total counter')
+        for cache_name, cache in caches.items():
+            lines.append(f'edoo_cache_{name}_total{{cache="{cache_name}"}} {getattr(cache, name)}')
+    lines.append('# HELP edoo_cache_hit_ratio Hits / lookups since start')
+    lines.append('# TYPE edoo_cache_hit_ratio gauge')
+    for cache_name, cache in caches.items():
+        lookups = cache.hits + cache.misses
+        lines.append(f'edoo_cache_hit_ratio{{cache="{cache_name}"}} {cache.hits / lookups if lookups else 0.0:.4f}')
+    lines.append('# HELP edoo_cache_entries Entries currently cached')
+    lines.append('# TYPE edoo_cache_entries gauge')
+    for cache_name, cache in caches.items():
+        lines.append(f'edoo_cache_entries{{cache="{cache_name}"}} {len(cache)}')
+
+    lines.append('# HELP edoo_simulation_saves_total Wizard saves by outcome')
+    lines.append('# TYPE edoo_simulation_saves_total counter')
+    with _save_stats_lock:
+        saves = dict(_save_stats)
+    lines.append(f'edoo_simulation_saves_total{{result="written"}} {saves["writes"]}')
+    lines.append(f'edoo_simulation_saves_total{{result="skipped"}} {saves["skipped"]}')
+    lines.append(f'edoo_simulation_saves_total{{result="coalesced"}} {saves["coalesced"]}')
+
+    if _write_behind is not None:
+        stats = _write_behind.stats()
+        lines.append('# TYPE edoo_write_behind_queue_depth gauge')
+        lines.append(f'edoo_write_behind_queue_depth {stats["queueDepth"]}')
+        lines.append('# TYPE edoo_write_behind_writes_total counter')
+        lines.append(f'edoo_write_behind_writes_total{{result="flushed"}} {stats["flushed"]}')
+        lines.append(f'edoo_write_behind_writes_total{{result="failed"}} {stats["failed"]}')
+    if _report_writes is not None:
+        stats = _report_writes.stats()
+        lines.append('# TYPE edoo_background_writes_pending gauge')
+        lines.append(f'edoo_background_writes_pending {stats["pending"]}')
+        lines.append('# TYPE edoo_background_writes_total counter')
+        for result in ('completed', 'superseded', 'failed'):
+            lines.append(f'edoo_background_writes_total{{result="{result}"}} {stats[result]}')
+    if _payment_events is not None:
+        stats = _payment_events.stats()
+        lines.append('# TYPE edoo_payment_events_queue_depth gauge')
+        lines.append(f'edoo_payment_events_queue_depth {stats["queueDepth"]}')
+        lines.append('# TYPE edoo_payment_event_batches_total counter')
+        lines.append(f'edoo_payment_event_batches_total {stats["batches"]}')
+        lines.append('# TYPE edoo_payment_events_applied_total counter')
+        lines.append(f'edoo_payment_events_applied_total{{result="applied"}} {stats["applied"]}')
+        lines.append(f'edoo_payment_events_applied_total{{result="failed"}} {stats["failed"]}')
+    return '\n'.join(lines) + '\n'
+
+def _label_worker(line, worker):
+    """Agrega el label worker a una muestra en formato de texto de Prometheus"""
+    brace, space = line.find('{'), line.find(' ')
+    if brace != -1 and brace < space:
+        return f'{line[:brace + 1]}worker="{worker}",{line[brace + 1:]}'
+    return f'{line[:space]}{{worker="{worker}"}}{line[space:]}'
+
+class MetricsSnapshots:
+    """Métricas de todos los workers de gunicorn a través de archivos en un directorio compartido.
+
+    Cada worker escribe su render en <pid>.prom cada METRICS_SNAPSHOT_INTERVAL
+    segundos. El worker que atiende /metrics junta los de los workers vivos con
+    un label worker, así un solo scrape ve todos los procesos (sumar con
+    `sum without (worker)`); lo de los otros workers puede tener unos segundos.
+    """
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Por pid y no por flag: con preload_app el módulo se importa en el master antes del fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._run, name='metrics-snapshots', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.write()
+            except Exception:
+                log.warning("Metrics snapshot failed", exc_info=True)
+            time.sleep(self.interval)
+
+    def write(self):
+        path = os.path.join(self.directory, f'{os.getpid()}.prom')
+        # Temporal por thread: un scrape y el snapshot periódico pueden escribir a la vez
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as stream:
+            stream.write(_render_metrics())
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def render(self):
+        """Muestras de todos los workers, agrupadas por familia como exige el formato"""
+        self.write()
+        families = OrderedDict()  # nombre -> (líneas HELP/TYPE, muestras)
+        for filename in sorted(os.listdir(self.directory)):
+            worker, extension = os.path.splitext(filename)
+            if extension != '.prom' or not worker.isdigit():
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                if not self._alive(int(worker)):
+                    # Worker muerto sin pasar por child_exit (p. ej. SIGKILL)
+                    os.remove(path)
+                    continue
+                with open(path, encoding='utf-8') as stream:
+                    text = stream.read()
+            except OSError:
+                continue
+            family = None
+            for line in text.splitlines():
+                if line.startswith('# '):
+                    family = families.setdefault(line.split(' ', 3)[2], ([], []))
+                    if line not in family[0]:
+                        family[0].append(line)
+                elif line and family is not None:
+                    family[1].append(_label_worker(line, worker))
+        lines = []
+        for header, samples in families.values():
+            lines.extend(header)
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+_metrics_snapshots = MetricsSnapshots(METRICS_DIR, METRICS_SNAPSHOT_INTERVAL) if METRICS_DIR else None
+
+# En Vercel solo /api/* llega a la función, de ahí el alias; cada instancia reporta solo lo suyo
+@app.route('/metrics')
+@app.route('/api/metrics')
+def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    if not METRICS_TOKEN and (request.path.startswith('/api/') or os.environ.get('VERCEL')):
+        # Expuesto a internet: sin token configurado no se publican rutas, tráfico ni colas
+        return jsonify({'success': False, 'message': 'No encontrado'}), 404
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'success': False, 'message': 'No autorizado'}), 401
+    body = _metrics_snapshots.render() if _metrics_snapshots is not None else _render_metrics()
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 # Rutas de API
 @app.route('/health')
 def health_check():
@@ -153,10 +1920,10 @@ def health_check():
     try:
         # Verify Supabase connection by trying to get a session
         # This is a basic check, a more robust one might query a public table
-        session_response = supabase.auth.get_session()
+        session_response = get_auth_client().auth.get_session()
         db_status = session_response.user is not None or session_response.session is not None
     except Exception as e:
-        print(f"Supabase health check failed: {e}")
+        log.warning("Supabase health check failed", extra={'error': str(e)})
         db_status = False
     
     return jsonify({
@@ -166,6 +1933,9 @@ def health_check():
             "flask_app": True,
             "database": db_status
         },
+        "simulationSaves": dict(_save_stats),
+        "writeBehind": _write_behind.stats() if _write_behind is not None else None,
+        "backgroundWrites": _report_writes.stats() if _report_writes is not None else None,
         "timestamp": time.time()
     })
 
@@ -197,10 +1967,11 @@ def register():
         if len(password) < 6:
             return jsonify({'success': False, 'message': 'La contraseña debe tener al menos 6 caracteres'}), 400
         
-        response = supabase.auth.sign_up({
-            "email": email,
-            "password": password
-        })
+        with timed('auth_remote'):
+            response = get_auth_client().auth.sign_up({
+                "email": email,
+                "password": password
+            })
         
         if response.user:
             # Optionally, insert user name into a 'profiles' table if needed
@@ -237,9 +2008,8 @@ def register():
                 error_message = response.error.message
             return jsonify({'success': False, 'message': error_message}), 400
 
-    except Exception as e:
-        print(f"Error in register: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in register")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -256,10 +2026,11 @@ def login():
         if not all([email, password]):
             return jsonify({'success': False, 'message': 'Email y contraseña son requeridos'}), 400
         
-        response = supabase.auth.sign_in_with_password({
-            "email": email,
-            "password": password
-        })
+        with timed('auth_remote'):
+            response = get_auth_client().auth.sign_in_with_password({
+                "email": email,
+                "password": password
+            })
         
         if response.user and response.session:
             return jsonify({
@@ -283,9 +2054,31 @@ def login():
                 error_message = response.error.message
             return jsonify({'success': False, 'message': error_message}), 401
 
-    except Exception as e:
-        print(f"Error in login: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in login")
+        return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
+
+@app.route('/api/auth/logout', methods=['POST'])
+@require_auth
+def logout():
+    """Cerrar sesión: la cierra en GoTrue y revoca el token en la caché de este worker.
+
+    El sign-out invalida los refresh tokens de la sesión; el access token sigue
+    siendo un JWT válido hasta su exp para otros workers que lo verifiquen localmente.
+    """
+    from gotrue.errors import AuthApiError
+    try:
+        revoke_token(request.access_token)
+        try:
+            with timed('auth_remote'):
+                get_auth_client().auth.admin.sign_out(request.access_token)
+        except AuthApiError as e:
+            # La sesión ya no existe en GoTrue (p. ej. un logout repetido): ya está cerrada
+            if e.status not in (401, 403, 404):
+                raise
+        return jsonify({'success': True, 'message': 'Sesión cerrada'})
+    except Exception:
+        log.exception("Error in logout")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 @app.route('/api/auth/profile', methods=['GET'])
@@ -293,32 +2086,23 @@ def login():
 def get_profile():
     """Obtener perfil del usuario"""
     try:
-        # The user is already authenticated by require_auth decorator
-        # We can fetch user details from Supabase if needed, or just return basic info
+        # The user is already authenticated by require_auth decorator,
+        # which already resolved id and email from the token claims
         user_id = request.user_id
-        # Example: Fetch user data from a 'profiles' table if you have one
-        # response = supabase.table('profiles').select('*').eq('id', user_id).single().execute()
-        # user_data = response.data
 
-        # For now, just return the user ID and email from the authenticated session
-        user_response = supabase.auth.get_user(request.access_token)
-        if user_response.user:
-            return jsonify({
-                'success': True,
-                'data': {
-                    'user': {
-                        'id': user_response.user.id,
-                        'email': user_response.user.email,
-                        'is_premium': False # This would come from your profiles table
-                    }
+        return jsonify({
+            'success': True,
+            'data': {
+                'user': {
+                    'id': user_id,
+                    'email': request.user_email,
+                    'is_premium': get_premium_status(user_id)
                 }
-            })
-        else:
-            return jsonify({'success': False, 'message': 'Usuario no encontrado'}), 404
+            }
+        })
     
-    except Exception as e:
-        print(f"Error in get_profile: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in get_profile")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 @app.route('/api/simulations', methods=['POST'])
@@ -330,32 +2114,94 @@ def save_simulation():
         if not data:
             return jsonify({'success': False, 'message': 'Datos requeridos'}), 400
             
-        wizard_data = json.dumps(data)
-        user_id = request.user_id
-
-        # Check if a simulation already exists for the user
-        existing_simulation = supabase.table('simulations').select('id').eq('user_id', user_id).execute()
-        
-        if existing_simulation.data:
-            # Update existing simulation
-            response = supabase.table('simulations').update({'wizard_data': wizard_data, 'created_at': datetime.utcnow().isoformat()}).eq('user_id', user_id).execute()
-        else:
-            # Insert new simulation
-            response = supabase.table('simulations').insert({'user_id': user_id, 'wizard_data': wizard_data, 'status': 'draft'}).execute()
-            
-        if response.data:
+        if _write_behind is not None:
+            # Se encola y el flusher en segundo plano agrupa la ráfaga en una sola escritura
+            wizard_hash = content_hash(data)
+            # Solo se omite si repite el guardado pendiente; contra la base decide el flush
+            queued = wizard_hash != _write_behind.pending_hash(request.user_id)
+            if queued:
+                _write_behind.enqueue(request.user_id, data, wizard_hash)
+                invalidate_etags(request.user_id)
+            else:
+                _count_save('skipped')
             return jsonify({
                 'success': True,
-                'message': 'Datos guardados exitosamente'
+                'message': 'Datos guardados exitosamente' if queued else 'Sin cambios, no fue necesario guardar',
+                'data': {
+                    # Si se escribe o no lo decide la base al hacer flush
+                    'written': None if queued else False,
+                    'queued': queued
+                }
             })
-        else:
-            # Supabase client might return an empty data list even on success for insert/update
-            # A more robust check would be to verify status code or re-fetch
-            return jsonify({'success': False, 'message': 'Error al guardar simulación o no se pudo verificar la operación'}), 500
+
+        # Un único upsert por user_id; si el contenido no cambió no se escribe nada
+        written = upsert_simulation(request.user_id, data)
+        _count_save('writes' if written else 'skipped')
+        return jsonify({
+            'success': True,
+            'message': 'Datos guardados exitosamente' if written else 'Sin cambios, no fue necesario guardar',
+            'data': {
+                'written': written
+            }
+        })
     
-    except Exception as e:
-        print(f"Error in save_simulation: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in save_simulation")
+        return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
+
+@app.route('/api/simulations/step/<int:step>', methods=['PATCH'])
+@require_auth
+def save_simulation_step(step):
+    """Guardar solo los cambios de un paso del wizard"""
+    try:
+        if not 1 <= step <= WIZARD_STEPS:
+            return jsonify({'success': False, 'message': 'Paso inválido'}), 400
+
+        data = request.get_json()
+        if not data or not isinstance(data.get('data'), dict):
+            return jsonify({'success': False, 'message': 'Datos del paso requeridos'}), 400
+
+        expected_version = data.get('version')
+        if expected_version is not None and not isinstance(expected_version, int):
+            return jsonify({'success': False, 'message': 'Versión inválida'}), 400
+
+        user_id = request.user_id
+        if _write_behind is not None:
+            # Un guardado completo pendiente pisaría este paso al escribirse después
+            _write_behind.flush(user_id)
+        # El merge se hace en la base de datos (migrations/002_simulation_step_versions.sql):
+        # solo viaja el paso editado y la versión evita pisar cambios de otra pestaña
+        with timed('db_rpc'):
+            response = get_supabase().rpc('merge_simulation_step', {
+                'p_user_id': user_id,
+                'p_step': f'step{step}',
+                'p_data': data['data'],
+                'p_expected_version': expected_version
+            }).execute()
+        invalidate_etags(user_id)
+
+        result = response.data[0]
+        if result['conflict']:
+            return jsonify({
+                'success': False,
+                'message': 'El paso fue modificado desde otra sesión',
+                'data': {
+                    'step': step,
+                    'version': result['new_version']
+                }
+            }), 409
+
+        return jsonify({
+            'success': True,
+            'message': 'Paso guardado exitosamente',
+            'data': {
+                'step': step,
+                'version': result['new_version']
+            }
+        })
+
+    except Exception:
+        log.exception("Error in save_simulation_step")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 @app.route('/api/simulations/current', methods=['GET'])
@@ -364,25 +2210,46 @@ def get_current_simulation():
     """Obtener simulación actual"""
     try:
         user_id = request.user_id
-        response = supabase.table('simulations').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
+        if _report_writes is not None:
+            _report_writes.wait(user_id)
+        pending = _write_behind.pending(user_id) if _write_behind is not None else None
+        cached_etag = _resource_etags.get((user_id, 'simulation'))
+        if pending is None and cached_etag and request.if_none_match.contains(cached_etag):
+            # Nada cambió desde la última respuesta: ni base de datos ni cuerpo
+            return not_modified(cached_etag)
+        
+        with timed('db_select'):
+            # Sin report_data ni hashes: el reporte (cashFlow, riskAnalysis) no se usa acá.
+            # Sin espacios: postgrest-py manda el select tal cual y un espacio pasa a ser parte de la clave
+            response = get_supabase().table('simulations').select('wizard_data,status,step_versions').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
         
-        if response.data:
-            simulation = response.data[0]
-            wizard_data = json.loads(simulation['wizard_data']) if simulation['wizard_data'] else {}
+        if response.data or pending is not None:
+            simulation = response.data[0] if response.data else {'wizard_data': None, 'status': 'draft'}
+            wizard_source = _write_behind.pending_hash(user_id) if pending is not None else simulation['wizard_data']
+            etag = resource_etag(wizard_source or '', simulation['status'], simulation.get('step_versions') or {})
+            if pending is None:
+                _resource_etags.set((user_id, 'simulation'), etag)
+            if request.if_none_match.contains(etag):
+                return not_modified(etag)
             
-            return jsonify({
+            if pending is not None:
+                wizard_data = pending
+            else:
+                wizard_data = decode_document(simulation['wizard_data']) or {}
+            
+            return with_etag(jsonify({
                 'success': True,
                 'data': {
                     'wizardData': wizard_data,
+                    'stepVersions': simulation.get('step_versions') or {},
                     'status': simulation['status']
                 }
-            })
+            }), etag)
         else:
             return jsonify({'success': False, 'message': 'No se encontró simulación'}), 404
     
-    except Exception as e:
-        print(f"Error in get_current_simulation: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in get_current_simulation")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 @app.route('/api/reports/generate', methods=['POST'])
@@ -391,29 +2258,171 @@ def generate_report():
     """Generar análisis financiero"""
     try:
         user_id = request.user_id
+        if _write_behind is not None:
+            # El reporte debe usar (y actualizar) la fila con el último guardado encolado
+            _write_behind.flush(user_id)
         # Get simulation data
-        simulation_response = supabase.table('simulations').select('wizard_data').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
+        if SIMULATION_STORAGE == 'jsonb':
+            # Solo los pasos que usa el motor, no el wizard completo
+            # Sin espacios: postgrest-py manda el select tal cual y " step5" volvería como otra clave
+            projection = ','.join(f'{step}:wizard_data->{step}' for step in REPORT_INPUT_STEPS)
+            with timed('db_select'):
+                simulation_response = get_supabase().table('simulations').select(f'{projection},report_hash').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
+        else:
+            with timed('db_select'):
+                simulation_response = get_supabase().table('simulations').select('wizard_data,report_hash').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
         
-        if not simulation_response.data or not simulation_response.data[0]['wizard_data']:
+        if not simulation_response.data:
+            return jsonify({'success': False, 'message': 'No se encontraron datos de simulación para generar el reporte'}), 404
+        simulation = simulation_response.data[0]
+        if SIMULATION_STORAGE == 'jsonb':
+            wizard_data = {step: simulation[step] for step in REPORT_INPUT_STEPS if isinstance(simulation.get(step), dict)}
+        else:
+            wizard_data = decode_document(simulation['wizard_data'])
+        if wizard_data is None:
             return jsonify({'success': False, 'message': 'No se encontraron datos de simulación para generar el reporte'}), 404
         
-        wizard_data = json.loads(simulation_response.data[0]['wizard_data'])
-        report_data = calculate_financial_analysis(wizard_data)
+        body = request.get_json(silent=True) or {}
+        projection_options, error = parse_projection_options(body.get('projection'))
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
+        risk_options, error = parse_risk_options(body.get('risk'))
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
+        
+        report_hash = report_cache_key(wizard_data, {'projection': projection_options, 'risk': risk_options})
+        report_data = _report_cache.get(report_hash)
+        
+        if simulation.get('report_hash') == report_hash:
+            # Las entradas no cambiaron desde el último reporte: no se recalcula ni se escribe
+            if report_data is None:
+                with timed('db_select'):
+                    stored = get_supabase().table('simulations').select('report_data').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
+                if stored.data and stored.data[0]['report_data']:
+                    report_data = decode_document(stored.data[0]['report_data'])
+                    _report_cache.set(report_hash, report_data)
+            if report_data is not None:
+                return jsonify({
+                    'success': True,
+                    'message': 'Reporte generado exitosamente',
+                    'cached': True,
+                    'data': report_data
+                })
+        
+        if report_data is None:
+            with timed('engine'):
+                report_data = calculate_financial_analysis(wizard_data)
+                if report_data:
+                    report_data['cashFlow'] = generate_cash_flow_projection(
+                        report_data, wizard_data,
+                        months=projection_options['months'],
+                        inflation=projection_options['inflation'],
+                        tuition_schedule=projection_options['tuitionSchedule'],
+                        compact=projection_options['compact']
+                    )
+                    if risk_options['mode'] == 'monte_carlo':
+                        # Sin semilla explícita se deriva de las entradas: mismo reporte, mismo resultado
+                        seed = risk_options['seed'] if risk_options['seed'] is not None else int(report_hash[:16], 16)
+                        risk_analysis = simulate_risk_monte_carlo(
+                            report_data, wizard_data,
+                            months=projection_options['months'],
+                            tuition_schedule=projection_options['tuitionSchedule'],
+                            inflation=projection_options['inflation'],
+                            paths=risk_options['paths'],
+                            seed=seed
+                        )
+                        report_data['riskAnalysis'] = risk_analysis
+                        report_data['summary']['riskLevel'] = risk_analysis['riskLevel']
+                        report_data['summary']['riskScore'] = risk_analysis['riskScore']
         
         if report_data:
             # Update simulation with report data
-            supabase.table('simulations').update({'report_data': json.dumps(report_data), 'status': 'completed'}).eq('user_id', user_id).execute()
+            _report_cache.set(report_hash, report_data)
+            if _report_writes is not None:
+                # Fire-and-forget: la respuesta no espera al UPDATE; las lecturas del usuario sí
+                invalidate_etags(user_id)
+                _report_writes.submit(user_id, store_report, user_id, report_data, report_hash)
+            else:
+                store_report(user_id, report_data, report_hash)
             return jsonify({
                 'success': True,
                 'message': 'Reporte generado exitosamente',
+                'cached': False,
                 'data': report_data
             })
         else:
             return jsonify({'success': False, 'message': 'Error al generar el análisis financiero'}), 500
     
-    except Exception as e:
-        print(f"Error in generate_report: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in generate_report")
+        return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
+
+@app.route('/api/reports/generate-batch', methods=['POST'])
+@require_auth
+def generate_report_batch():
+    """Generar análisis financiero para muchos perfiles (respuesta NDJSON)"""
+    try:
+        data = request.get_json()
+        profiles = data.get('profiles') if isinstance(data, dict) else None
+        if not isinstance(profiles, list) or not profiles:
+            return jsonify({'success': False, 'message': 'Lista de perfiles requerida'}), 400
+        if len(profiles) > BATCH_MAX_PROFILES:
+            return jsonify({'success': False, 'message': f'Máximo {BATCH_MAX_PROFILES} perfiles por solicitud'}), 413
+
+        def generate():
+            # Se calcula y se envía por bloques para no retener toda la respuesta en memoria
+            for start in range(0, len(profiles), BATCH_CHUNK_SIZE):
+                results = calculate_financial_analysis_batch(profiles[start:start + BATCH_CHUNK_SIZE])
+                yield ''.join(
+                    json_dumps({'index': start + offset, 'success': result is not None, 'data': result}) + '\n'
+                    for offset, result in enumerate(results)
+                )
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    except Exception:
+        log.exception("Error in generate_report_batch")
+        return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
+
+@app.route('/api/reports/what-if', methods=['POST'])
+@require_auth
+def what_if_report():
+    """Comparar escenarios (producto cartesiano de ejes) sin tocar la base de datos"""
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict) or not isinstance(data.get('base', {}), dict):
+            return jsonify({'success': False, 'message': 'Datos requeridos'}), 400
+
+        # Lista (no objeto) para que el orden de los ejes defina el orden de la matriz
+        raw_axes = data.get('axes')
+        if not isinstance(raw_axes, list) or not raw_axes or not all(isinstance(axis, dict) for axis in raw_axes):
+            return jsonify({'success': False, 'message': 'Ejes requeridos: [{"field": ..., "values": [...]}]'}), 400
+        axes = []
+        cells = 1
+        for axis in raw_axes:
+            field, values = axis.get('field'), axis.get('values')
+            if field not in WHAT_IF_FIELDS or any(field == existing for existing, _ in axes):
+                return jsonify({'success': False, 'message': f'Eje no soportado: {field} (opciones: {", ".join(WHAT_IF_FIELDS)})'}), 400
+            if not isinstance(values, list) or not values:
+                return jsonify({'success': False, 'message': f'El eje {field} necesita una lista de valores'}), 400
+            axes.append((field, values))
+            cells *= len(values)
+        if cells > WHAT_IF_MAX_CELLS:
+            return jsonify({'success': False, 'message': f'Máximo {WHAT_IF_MAX_CELLS} combinaciones por solicitud'}), 413
+
+        try:
+            with timed('engine'):
+                grid = evaluate_what_if_grid(data.get('base', {}), axes)
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Valores de escenario inválidos'}), 400
+
+        return jsonify({
+            'success': True,
+            'data': grid
+        })
+
+    except Exception:
+        log.exception("Error in what_if_report")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 @app.route('/api/reports/current', methods=['GET'])
@@ -422,20 +2431,72 @@ def get_current_report():
     """Obtener reporte actual"""
     try:
         user_id = request.user_id
-        response = supabase.table('simulations').select('report_data').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
+        if _report_writes is not None:
+            _report_writes.wait(user_id)
+        cached_etag = _resource_etags.get((user_id, 'report'))
+        if cached_etag and request.if_none_match.contains(cached_etag):
+            return not_modified(cached_etag)
+        
+        with timed('db_select'):
+            response = get_supabase().table('simulations').select('report_data').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
         
         if response.data and response.data[0]['report_data']:
-            report_data = json.loads(response.data[0]['report_data'])
-            return jsonify({
+            raw_report = response.data[0]['report_data']
+            etag = resource_etag(raw_report)
+            _resource_etags.set((user_id, 'report'), etag)
+            if request.if_none_match.contains(etag):
+                return not_modified(etag)
+            
+            report_data = decode_document(raw_report)
+            return with_etag(jsonify({
                 'success': True,
                 'data': report_data
-            })
+            }), etag)
         else:
             return jsonify({'success': False, 'message': 'No se encontró análisis previo'}), 404
     
-    except Exception as e:
-        print(f"Error in get_current_report: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in get_current_report")
+        return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
+
+@app.route('/api/reports/export/pdf', methods=['GET'])
+@require_auth
+def export_report_pdf():
+    """Exportar análisis a PDF"""
+    try:
+        user_id = request.user_id
+        if _report_writes is not None:
+            _report_writes.wait(user_id)
+        # Con el ETag del reporte en caché y el PDF en disco no hace falta leer la base
+        cached_etag = _resource_etags.get((user_id, 'report'))
+        if cached_etag:
+            key = pdf_cache_key(cached_etag)
+            if request.if_none_match.contains(key):
+                return not_modified(key)
+            try:
+                response = send_pdf(key)
+                _pdf_exports.inc('hit')
+                return response
+            except FileNotFoundError:
+                pass
+        
+        with timed('db_select'):
+            response = get_supabase().table('simulations').select('report_data').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
+        
+        if not response.data or not response.data[0]['report_data']:
+            return jsonify({'success': False, 'message': 'No se encontró análisis para exportar'}), 404
+        raw_report = response.data[0]['report_data']
+        report_etag = resource_etag(raw_report)
+        _resource_etags.set((user_id, 'report'), report_etag)
+        key = pdf_cache_key(report_etag)
+        if request.if_none_match.contains(key):
+            return not_modified(key)
+        
+        render_pdf_cached(key, raw_report)
+        return send_pdf(key)
+    
+    except Exception:
+        log.exception("Error in export_report_pdf")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 # Rutas de pagos (demo)
@@ -469,38 +2530,179 @@ def create_checkout_session():
             }
         }), 200
 
-    except Exception as e:
-        print(f"Error in create_checkout_session: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in create_checkout_session")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 @app.route('/api/payments/webhook', methods=['POST'])
 def payment_webhook():
-    """Webhook para procesar pagos (demo)"""
+    """Webhook para procesar pagos: verifica la firma, descarta duplicados y encola"""
     try:
-        event = request.get_json()
-        # In a real application, verify webhook signature
-        # Process the event, e.g., update user's premium status
-        print(f"Received payment webhook event: {event.get('type')}")
+        if not PAYMENT_WEBHOOK_SECRET:
+            log.error("Payment webhook received but PAYMENT_WEBHOOK_SECRET is not set")
+            return jsonify({'success': False, 'message': 'Webhook no configurado'}), 503
+        payload = request.get_data(cache=False)
+        if not verify_webhook_signature(payload, request.headers.get('Stripe-Signature'), PAYMENT_WEBHOOK_SECRET):
+            _webhook_events.inc('invalid_signature')
+            return jsonify({'success': False, 'message': 'Firma inválida'}), 400
+        try:
+            event = json_loads(payload)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict) or not event.get('id'):
+            return jsonify({'success': False, 'message': 'Evento inválido'}), 400
+        
+        event_id = event['id']
+        if not _webhook_event_ids.add(event_id, True):
+            _webhook_events.inc('duplicate')
+            return jsonify({'success': True, 'message': 'Webhook ya recibido'}), 200
+        update = premium_update_from_event(event)
+        if update is None:
+            _webhook_events.inc('ignored')
+            return jsonify({'success': True, 'message': 'Webhook recibido'}), 200
+        
+        if _payment_events is not None:
+            if not _payment_events.enqueue(event_id, update):
+                _webhook_event_ids.pop(event_id)
+                _webhook_events.inc('rejected')
+                response = jsonify({'success': False, 'message': 'Webhook no procesado, reintentar'})
+                response.headers['Retry-After'] = '5'
+                return response, 503
+        else:
+            try:
+                apply_premium_updates([update])
+            except Exception:
+                # Sin marcar como recibido, el reintento del proveedor lo vuelve a aplicar
+                _webhook_event_ids.pop(event_id)
+                raise
+        _webhook_events.inc('accepted')
+        log.info("Received payment webhook event", extra={'event_id': event_id, 'event_type': event.get('type')})
         return jsonify({'success': True, 'message': 'Webhook recibido'}), 200
-    except Exception as e:
-        print(f"Error in payment_webhook: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in payment_webhook")
         return jsonify({'success': False, 'message': 'Error interno del servidor'}), 500
 
 # Rutas para servir el frontend (archivos estáticos)
+class StaticEntry:
+    """Archivo estático en memoria con su ETag y variantes comprimidas"""
+    COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'image/vnd.microsoft.icon', 'image/x-icon')
+
+    def __init__(self, full_path, rel_path, stat):
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        with open(full_path, 'rb') as f:
+            self.data = f.read()
+        self.hash = hashlib.sha256(self.data).hexdigest()[:32]
+        self.mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        # Los bundles de Vite llevan el hash en el nombre: nunca cambian
+        self.cache_control = 'public, max-age=31536000, immutable' if rel_path.startswith('assets/') else 'no-cache'
+        self.compressible = self.size >= STATIC_MIN_COMPRESS_SIZE and self.mimetype.startswith(self.COMPRESSIBLE_TYPES)
+        self._variants = {}
+        self._lock = threading.Lock()
+        # Variantes ya generadas en el build (archivo.br / archivo.gz), si existen
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if os.path.exists(full_path + suffix):
+                with open(full_path + suffix, 'rb') as f:
+                    self._variants[encoding] = f.read()
+
+    def variant(self, encoding):
+        """Contenido comprimido; se genera una sola vez y queda en memoria"""
+        data = self._variants.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._variants.get(encoding)
+                if data is None:
+                    data = brotli.compress(self.data) if encoding == 'br' else gzip.compress(self.data, compresslevel=9, mtime=0)
+                    self._variants[encoding] = data
+        return data
+
+    def etag(self, encoding=None):
+        # ETag fuerte distinto por codificación, como exige RFC 9110
+        return f"{self.hash}-{encoding}" if encoding else self.hash
+
+class StaticManifest:
+    """Índice en memoria de STATIC_DIR para servir sin tocar el disco por request.
+
+    Se escanea en el primer request; un path desconocido con extensión provoca
+    un nuevo escaneo (como máximo cada STATIC_RESCAN_INTERVAL segundos) para
+    detectar archivos publicados después. Las rutas del SPA (/dashboard,
+    /simulacion/3) no son archivos y nunca disparan el escaneo.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.entries = {}
+        self.scanned_at = 0.0
+        self._lock = threading.Lock()
+
+    def scan(self):
+        entries = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                full_path = os.path.join(dirpath, name)
+                rel_path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                stat = os.stat(full_path)
+                previous = self.entries.get(rel_path)
+                if previous is not None and previous.mtime == stat.st_mtime and previous.size == stat.st_size:
+                    entries[rel_path] = previous
+                else:
+                    entries[rel_path] = StaticEntry(full_path, rel_path, stat)
+        self.entries = entries
+        self.scanned_at = time.time()
+
+    @staticmethod
+    def _is_file_path(path):
+        return '.' in path.rsplit('/', 1)[-1]
+
+    def lookup(self, path):
+        entry = self.entries.get(path)
+        if (entry is None and (not self.scanned_at or self._is_file_path(path))
+                and time.time() - self.scanned_at >= STATIC_RESCAN_INTERVAL):
+            with self._lock:
+                if time.time() - self.scanned_at >= STATIC_RESCAN_INTERVAL:
+                    self.scan()
+            entry = self.entries.get(path)
+        return entry
+
+_static_manifest = StaticManifest(STATIC_DIR)
+
+def _negotiate_encoding(entry):
+    if not entry.compressible:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_frontend(path):
     """Sirve los archivos estáticos del frontend"""
-    print(f"Serving static file: {path}")
-    if path != "" and os.path.exists(os.path.join(STATIC_DIR, path)):
-        return send_from_directory(STATIC_DIR, path)
+    entry = _static_manifest.lookup(path) if path else None
+    if entry is None:
+        # SPA: cualquier ruta desconocida devuelve el shell
+        entry = _static_manifest.lookup('index.html')
+        if entry is None:
+            return jsonify({'success': False, 'message': 'Frontend no disponible'}), 404
+
+    encoding = _negotiate_encoding(entry)
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag or any(if_none_match.contains(entry.etag(e)) for e in (None, 'gzip', 'br')):
+        response = Response(status=304)
     else:
-        return send_from_directory(STATIC_DIR, 'index.html')
+        response = Response(entry.variant(encoding) if encoding else entry.data, mimetype=entry.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(entry.etag(encoding))
+    response.headers['Cache-Control'] = entry.cache_control
+    response.vary.add('Accept-Encoding')
+    return response
 
 if __name__ == '__main__':
     # This block is for local development only
     # Vercel will use a WSGI server (like Gunicorn) to run the app
-    print("Running Flask app in development mode...")
+    log.info("Running Flask app in development mode")
     app.run(debug=True, host='0.0.0.0', port=5000)
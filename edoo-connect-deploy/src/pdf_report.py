@@ -0,0 +1,245 @@
+"""Render del análisis financiero a PDF, sin dependencias externas.
+
+Vive fuera de main.py para que los procesos del pool de exportación
+(arrancados con spawn) solo importen este módulo y no la app completa.
+El documento se escribe página por página en el archivo de destino, así
+que nunca está entero en memoria.
+"""
+import json
+import os
+import zlib
+from datetime import datetime
+
+# Cambiarlo invalida los PDFs cacheados en disco
+RENDERER_VERSION = 1
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 en puntos
+MARGIN = 50
+LINE_GAP = 1.35
+# Ancho medio de un carácter de Helvetica en em, para cortar líneas sin métricas completas
+AVG_CHAR_WIDTH = 0.5
+
+RISK_LABELS = {'low': 'Bajo', 'medium': 'Medio', 'high': 'Alto'}
+COST_LABELS = (
+    ('tuition', 'Matrícula'),
+    ('housing', 'Vivienda'),
+    ('food', 'Alimentación'),
+    ('transport', 'Transporte'),
+    ('insurance', 'Seguro médico'),
+    ('miscellaneous', 'Otros gastos'),
+)
+TOTAL_LABELS = (
+    ('monthly', 'Gastos de vida mensuales'),
+    ('livingExpenses', 'Gastos de vida anuales'),
+    ('tuitionOnly', 'Matrícula'),
+    ('yearly', 'Total primer año'),
+)
+CASH_FLOW_COLUMNS = (
+    ('month', 'Mes', 0),
+    ('income', 'Ingresos', 60),
+    ('expenses', 'Gastos', 160),
+    ('netFlow', 'Flujo neto', 260),
+    ('cumulativeBalance', 'Saldo acumulado', 360),
+)
+
+def _money(value):
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return '-'
+    return f"{'-' if amount < 0 else ''}${abs(amount):,.0f}"
+
+def _pdf_text(text):
+    """Texto como string literal de PDF en WinAnsiEncoding"""
+    data = str(text).encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+def _wrap(text, size, width):
+    max_chars = max(10, int(width / (size * AVG_CHAR_WIDTH)))
+    lines, current = [], ''
+    for word in str(text).split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            lines.append(current)
+            current = word
+        else:
+            current = f'{current} {word}' if current else word
+    if current:
+        lines.append(current)
+    return lines or ['']
+
+class PdfWriter:
+    """Escritor PDF 1.4 mínimo: texto en Helvetica/Helvetica-Bold y líneas horizontales"""
+    # Objetos fijos; las páginas se numeran a partir de FIRST_PAGE_OBJECT
+    CATALOG, PAGES, FONT_REGULAR, FONT_BOLD = 1, 2, 3, 4
+    FIRST_PAGE_OBJECT = 5
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offsets = {}
+        self.pages = []
+        self.next_object = self.FIRST_PAGE_OBJECT
+        self.position = 0
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._new_page()
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.position += len(data)
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        self._write(f'{number} 0 obj\n'.encode('ascii') + body + b'\nendobj\n')
+
+    def _new_page(self):
+        self.ops = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _flush_page(self):
+        content = zlib.compress(b'\n'.join(self.ops))
+        page_number, content_number = self.next_object, self.next_object + 1
+        self.next_object += 2
+        self._object(content_number, f'<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n'.encode('ascii') + content + b'\nendstream')
+        self._object(page_number, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 {self.FONT_REGULAR} 0 R /F2 {self.FONT_BOLD} 0 R >> >> '
+            f'/Contents {content_number} 0 R >>'
+        ).encode('ascii'))
+        self.pages.append(page_number)
+
+    def ensure_space(self, height):
+        if self.y - height < MARGIN + 20:
+            self.footer()
+            self._flush_page()
+            self._new_page()
+
+    def text(self, value, size=10, bold=False, x=0, advance=True):
+        if advance:
+            self.ensure_space(size * LINE_GAP)
+            self.y -= size * LINE_GAP
+        font = b'/F2' if bold else b'/F1'
+        self.ops.append(b'BT ' + font + f' {size} Tf {MARGIN + x:.1f} {self.y:.1f} Td '.encode('ascii') + _pdf_text(value) + b' Tj ET')
+
+    def paragraph(self, value, size=10, bold=False, x=0):
+        for line in _wrap(value, size, PAGE_WIDTH - 2 * MARGIN - x):
+            self.text(line, size=size, bold=bold, x=x)
+
+    def rule(self, gap=6):
+        self.ensure_space(gap * 2)
+        self.y -= gap
+        self.ops.append(f'0.6 G 0.5 w {MARGIN} {self.y:.1f} m {PAGE_WIDTH - MARGIN} {self.y:.1f} l S 0 G'.encode('ascii'))
+        self.y -= gap
+
+    def space(self, height=8):
+        self.y -= height
+
+    def footer(self):
+        self.ops.append(b'BT /F1 8 Tf ' + f'{MARGIN} {MARGIN - 10} Td '.encode('ascii')
+                        + _pdf_text(f'EdooConnect - página {len(self.pages) + 1}') + b' Tj ET')
+
+    def close(self):
+        self.footer()
+        self._flush_page()
+        kids = ' '.join(f'{number} 0 R' for number in self.pages)
+        self._object(self.PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>'.encode('ascii'))
+        for number, name in ((self.FONT_REGULAR, 'Helvetica'), (self.FONT_BOLD, 'Helvetica-Bold')):
+            self._object(number, f'<< /Type /Font /Subtype /Type1 /BaseFont /{name} /Encoding /WinAnsiEncoding >>'.encode('ascii'))
+        self._object(self.CATALOG, f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>'.encode('ascii'))
+        xref_position = self.position
+        total = self.next_object
+        xref = [f'xref\n0 {total}\n', '0000000000 65535 f \n']
+        xref.extend(f'{self.offsets[number]:010d} 00000 n \n' for number in range(1, total))
+        self._write(''.join(xref).encode('ascii'))
+        self._write(f'trailer\n<< /Size {total} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref_position}\n%%EOF\n'.encode('ascii'))
+
+def _cash_flow_rows(projection):
+    if isinstance(projection, dict) and projection.get('format') == 'columnar':
+        columns = projection['columns']
+        return (dict(zip(columns, row)) for row in zip(*columns.values()))
+    return iter(projection or [])
+
+def _write_report(pdf, report):
+    summary = report.get('summary') or {}
+    costs = report.get('costs') or {}
+    metadata = report.get('metadata') or {}
+
+    pdf.text('EdooConnect - Análisis financiero', size=18, bold=True)
+    pdf.text(f"{metadata.get('location', '')}   ·   generado {str(metadata.get('generatedAt', ''))[:10]}", size=9)
+    pdf.rule()
+
+    pdf.text('Resumen', size=13, bold=True)
+    pdf.text(f"Gastos mensuales: {_money(summary.get('monthlyExpenses'))}")
+    pdf.text(f"Total primer año: {_money(summary.get('yearlyTotal'))}")
+    pdf.text(f"Nivel de riesgo: {RISK_LABELS.get(summary.get('riskLevel'), summary.get('riskLevel', '-'))}"
+             f"   (puntaje {summary.get('riskScore', '-')}/100)")
+    pdf.space()
+
+    pdf.text('Costos estimados (USD)', size=13, bold=True)
+    breakdown = costs.get('breakdown') or {}
+    for key, label in COST_LABELS:
+        if key in breakdown:
+            pdf.text(label)
+            pdf.text(_money(breakdown[key]), x=220, advance=False)
+    totals = costs.get('totals') or {}
+    pdf.rule(4)
+    for key, label in TOTAL_LABELS:
+        if key in totals:
+            pdf.text(label, bold=True)
+            pdf.text(_money(totals[key]), bold=True, x=220, advance=False)
+    pdf.space()
+
+    cash_flow = report.get('cashFlow')
+    if cash_flow:
+        flow_summary = cash_flow.get('summary') or {}
+        pdf.text('Flujo de caja proyectado', size=13, bold=True)
+        pdf.text(f"{flow_summary.get('months', '-')} meses, inflación {float(flow_summary.get('inflation') or 0):.1%}, "
+                 f"saldo final {_money(flow_summary.get('finalBalance'))}, "
+                 f"meses en déficit {flow_summary.get('monthsInDeficit', 0)}", size=9)
+        pdf.space(4)
+        for _, label, x in CASH_FLOW_COLUMNS:
+            pdf.text(label, size=9, bold=True, x=x, advance=x == 0)
+        for row in _cash_flow_rows(cash_flow.get('projection')):
+            for key, _, x in CASH_FLOW_COLUMNS:
+                value = row.get(key)
+                pdf.text(value if key == 'month' else _money(value), size=9, x=x, advance=x == 0)
+        pdf.space()
+
+    risk = report.get('riskAnalysis')
+    if risk:
+        pdf.text('Análisis de riesgo (Monte Carlo)', size=13, bold=True)
+        pdf.text(f"Probabilidad de quedarse sin fondos: {float(risk.get('probabilityOfShortfall') or 0):.1%}"
+                 f"   ({risk.get('paths', '-')} escenarios, {risk.get('months', '-')} meses)")
+        if risk.get('medianShortfallMonth') is not None:
+            pdf.text(f"Mes mediano del primer déficit: {risk['medianShortfallMonth']}")
+        percentiles = risk.get('finalBalancePercentiles') or {}
+        if percentiles:
+            pdf.text('Saldo final por percentil: ' + ', '.join(f'{name} {_money(value)}' for name, value in percentiles.items()))
+        pdf.space()
+
+    recommendations = report.get('basicRecommendations') or []
+    if recommendations:
+        pdf.text('Recomendaciones', size=13, bold=True)
+        for recommendation in recommendations:
+            pdf.paragraph(recommendation.get('title', ''), bold=True)
+            pdf.paragraph(recommendation.get('description', ''), size=9, x=10)
+            pdf.space(4)
+
+def render_report_pdf(report, path):
+    """Escribe el reporte (dict o texto JSON) como PDF en `path`; devuelve el tamaño en bytes.
+
+    Se escribe a un temporal y se renombra, así un lector concurrente nunca
+    ve un archivo a medio escribir.
+    """
+    if isinstance(report, (str, bytes)):
+        report = json.loads(report)
+    temp_path = f'{path}.{os.getpid()}.{datetime.now().strftime("%H%M%S%f")}.tmp'
+    try:
+        with open(temp_path, 'wb') as stream:
+            pdf = PdfWriter(stream)
+            _write_report(pdf, report)
+            pdf.close()
+            size = pdf.position
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return size
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'bench'))
+
+import fake_supabase
+
+# Supabase local (el mismo fake de los benchmarks), sin latencia; main lee esta configuración al importarse
+_server, _supabase_url = fake_supabase.start()
+os.environ.update({
+    'SUPABASE_URL': _supabase_url,
+    'SUPABASE_KEY': fake_supabase.ANON_KEY,
+    'SUPABASE_JWT_SECRET': fake_supabase.JWT_SECRET,
+    'LOG_ASYNC': 'false',
+    'LOG_SAMPLE_RATE': '0',
+})
+
+@pytest.fixture
+def supabase():
+    """Estado en memoria del fake; se vacía entre tests"""
+    state = _server.state
+    with state.lock:
+        state.users.clear()
+        state.simulations.clear()
+        state.profiles.clear()
+        del state.sign_outs[:]
+    return state
+
+@pytest.fixture
+def client(supabase):
+    import main
+    return main.app.test_client()
+
+@pytest.fixture
+def auth_headers(supabase):
+    """Registra usuarios en el fake y devuelve sus headers de auth"""
+    def create(email='user@example.com'):
+        _, session = supabase.sign_up({'email': email, 'password': 'password'})
+        return {'Authorization': f"Bearer {session['access_token']}"}
+    return create
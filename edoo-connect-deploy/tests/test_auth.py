@@ -0,0 +1,40 @@
+import time
+import uuid
+
+import fake_supabase
+import jwt
+
+def _token(key=fake_supabase.JWT_SECRET, **overrides):
+    now = int(time.time())
+    claims = {'sub': str(uuid.uuid4()), 'email': 'user@example.com', 'aud': 'authenticated',
+              'role': 'authenticated', 'iat': now, 'exp': now + 3600}
+    claims.update(overrides)
+    claims = {name: value for name, value in claims.items() if value is not None}
+    return {'Authorization': f"Bearer {jwt.encode(claims, key, algorithm='HS256')}"}
+
+def _profile_status(client, headers):
+    return client.get('/api/auth/profile', headers=headers).status_code
+
+def test_valid_token_is_accepted(client):
+    assert _profile_status(client, _token()) == 200
+
+def test_expired_token_is_rejected(client):
+    assert _profile_status(client, _token(exp=int(time.time()) - 10)) == 401
+
+def test_token_signed_with_another_key_is_rejected(client):
+    assert _profile_status(client, _token(key='not-the-project-secret-but-long-enough')) == 401
+
+def test_token_without_audience_is_rejected(client):
+    assert _profile_status(client, _token(aud=None)) == 401
+
+def test_missing_token_is_rejected(client):
+    assert _profile_status(client, {}) == 401
+
+def test_logout_signs_out_in_gotrue_and_revokes_token(client, supabase, auth_headers):
+    headers = auth_headers()
+    assert _profile_status(client, headers) == 200
+
+    response = client.post('/api/auth/logout', headers=headers)
+    assert response.status_code == 200
+    assert len(supabase.sign_outs) == 1
+    assert _profile_status(client, headers) == 401
@@ -0,0 +1,82 @@
+"""calculate_financial_analysis_batch debe dar exactamente lo mismo que la versión escalar."""
+import json
+import random
+
+import pytest
+
+import main
+
+FAMILY_STATUSES = ['single', 'couple', 'family', 'Couple', '', None, 3, ['family'], {'x': 1}]
+SAVINGS = [0, 1, -1, 45000, 900000, 10 ** 7, 2 ** 53 - 1, 2 ** 53, -(2 ** 60), 10 ** 30, 12.9, -0.5, True,
+           '45000', ' 12 ', '1e3', 'abc', '', None, [], {}]
+EXTRA_COUNTRIES = ['CANADA', 'Usa', 'narnia', '', None, 7]
+EXTRA_CITIES = ['Toronto', 'new york city', 'atlantis', '', None, 42]
+
+def _locations():
+    db = main.get_cost_db()
+    return sorted({key for key in db.index})
+
+def _random_step(rng, build):
+    """Paso válido casi siempre; a veces falta, es None o no es un dict"""
+    roll = rng.random()
+    if roll < 0.04:
+        return ('missing',)
+    if roll < 0.06:
+        return (None,)
+    if roll < 0.08:
+        return (rng.choice(['x', 5, []]),)
+    return (build(),)
+
+def random_profile(rng, locations):
+    country, state, city = rng.choice(locations)
+    steps = {
+        'step3': lambda: {'familyStatus': rng.choice(FAMILY_STATUSES)} if rng.random() < 0.9 else {},
+        'step5': lambda: {'currentSavings': rng.choice(SAVINGS) if rng.random() < 0.15 else rng.randint(-1000, 150000)} if rng.random() < 0.9 else {},
+        'step6': lambda: {'country': country if rng.random() < 0.8 else rng.choice(EXTRA_COUNTRIES)} if rng.random() < 0.95 else {},
+        'step7': lambda: {
+            key: value for key, value in (('state', state), ('city', city if rng.random() < 0.8 else rng.choice(EXTRA_CITIES)))
+            if value and rng.random() < 0.9
+        },
+    }
+    profile = {}
+    for name, build in steps.items():
+        value = _random_step(rng, build)
+        if value[0] != 'missing':
+            profile[name] = value[0]
+    return profile
+
+def canonical(result):
+    """JSON exacto (tipos incluidos: 1 != 1.0) sin la marca de tiempo"""
+    if result is None:
+        return None
+    result = json.loads(json.dumps(result))
+    result['metadata'].pop('generatedAt')
+    return json.dumps(result, sort_keys=True)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_matches_scalar_on_random_profiles(seed):
+    rng = random.Random(seed)
+    profiles = [random_profile(rng, _locations()) for _ in range(2000)]
+    batch = main.calculate_financial_analysis_batch(profiles)
+    assert len(batch) == len(profiles)
+    for profile, result in zip(profiles, batch):
+        assert canonical(result) == canonical(main.calculate_financial_analysis(profile)), profile
+
+@pytest.mark.parametrize('profile', [
+    {},
+    {'step3': None},
+    {'step5': {'currentSavings': 'abc'}},
+    {'step5': {'currentSavings': 2 ** 53}},
+    {'step5': {'currentSavings': 10 ** 30}},
+    {'step6': {'country': None}},
+    {'step6': {'country': 7}},
+    {'step7': 'toronto'},
+    {'step3': {'familyStatus': ['family']}, 'step6': {'country': 'USA'}, 'step7': {'city': 'Los Angeles'}},
+])
+def test_batch_matches_scalar_on_malformed_profiles(profile):
+    assert canonical(main.calculate_financial_analysis_batch([profile])[0]) == canonical(main.calculate_financial_analysis(profile))
+
+def test_batch_keeps_order_and_length():
+    profiles = [{'step5': {'currentSavings': savings}} for savings in range(0, 100000, 997)]
+    results = main.calculate_financial_analysis_batch(profiles)
+    assert [r['summary']['riskLevel'] for r in results] == [main.calculate_financial_analysis(p)['summary']['riskLevel'] for p in profiles]
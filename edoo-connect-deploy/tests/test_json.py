@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(main.orjson is None, reason='orjson not installed')
+
+@pytest.fixture
+def orjson_calls(monkeypatch):
+    calls = []
+    original = main.orjson.dumps
+    def spy(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(main.orjson, 'dumps', spy)
+    return calls
+
+def test_jsonify_uses_orjson(orjson_calls):
+    payload = {'b': 1, 'a': [1.5, None, 'ñ'], 'nested': {'z': True}}
+    with main.app.app_context():
+        response = main.jsonify(payload)
+    assert orjson_calls
+    assert json.loads(response.get_data()) == payload
+
+def test_indent_and_sort_keys_are_translated(orjson_calls):
+    text = main.app.json.dumps({'b': 1, 'a': 2}, indent=2, sort_keys=True)
+    assert orjson_calls
+    assert text == '{\n  "a": 2,\n  "b": 1\n}'
+
+def test_falls_back_for_values_orjson_rejects():
+    big = 2 ** 70
+    assert json.loads(main.app.json.dumps({'n': big}, separators=(',', ':'))) == {'n': big}
@@ -0,0 +1,44 @@
+import os
+
+import main
+
+def test_api_metrics_requires_configured_token(client, monkeypatch):
+    monkeypatch.setattr(main, 'METRICS_TOKEN', None)
+    assert client.get('/api/metrics').status_code == 404
+    monkeypatch.setenv('VERCEL', '1')
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setattr(main, 'METRICS_TOKEN', 'scrape-token')
+    assert client.get('/api/metrics').status_code == 401
+    response = client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-token'})
+    assert response.status_code == 200
+    assert b'# TYPE edoo_http_requests_total counter' in response.data
+
+def test_metrics_merge_all_workers(client, tmp_path, monkeypatch):
+    snapshots = main.MetricsSnapshots(str(tmp_path), interval=60)
+    monkeypatch.setattr(main, '_metrics_snapshots', snapshots)
+    # Otro worker vivo (el proceso padre) y uno que murió sin limpiar su archivo
+    other = os.getppid()
+    (tmp_path / f'{other}.prom').write_text(
+        '# HELP edoo_http_requests_total Requests by route and status\n'
+        '# TYPE edoo_http_requests_total counter\n'
+        'edoo_http_requests_total{method="GET",route="/api/health",status="200"} 7\n'
+        '# TYPE edoo_payment_event_batches_total counter\n'
+        'edoo_payment_event_batches_total 3\n'
+    )
+    (tmp_path / '999999999.prom').write_text('# TYPE edoo_dead_total counter\nedoo_dead_total 1\n')
+    client.get('/api/health')
+
+    lines = client.get('/metrics').get_data(as_text=True).splitlines()
+    assert lines.count('# TYPE edoo_http_requests_total counter') == 1
+    start = lines.index('# TYPE edoo_http_requests_total counter')
+    family = []
+    for line in lines[start + 1:]:
+        if line.startswith('#'):
+            break
+        family.append(line)
+    assert f'edoo_http_requests_total{{worker="{other}",method="GET",route="/api/health",status="200"}} 7' in family
+    assert any(line.startswith(f'edoo_http_requests_total{{worker="{os.getpid()}",') for line in family)
+    assert f'edoo_payment_event_batches_total{{worker="{other}"}} 3' in lines
+    assert not any('edoo_dead_total' in line for line in lines)
+    assert not (tmp_path / '999999999.prom').exists()
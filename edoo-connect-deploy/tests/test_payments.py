@@ -0,0 +1,72 @@
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+import main
+
+def test_older_event_does_not_overwrite_newer_plan(supabase):
+    user_id = str(uuid.uuid4())
+    assert main.apply_premium_updates([(user_id, True, 1_700_000_100)]) == 1
+    # Reintento atrasado de una cancelación anterior, en otro lote
+    assert main.apply_premium_updates([(user_id, False, 1_700_000_000)]) == 0
+    assert supabase.profiles[user_id]['is_premium'] is True
+    assert main.get_premium_status(user_id) is True
+
+    assert main.apply_premium_updates([(user_id, False, 1_700_000_200)]) == 1
+    assert main.get_premium_status(user_id) is False
+
+def test_dropped_update_forgets_event_id(monkeypatch):
+    def fail(updates):
+        raise RuntimeError('supabase down')
+
+    monkeypatch.setattr(main, 'apply_premium_updates', fail)
+    monkeypatch.setattr(main, 'WEBHOOK_MAX_ATTEMPTS', 1)
+    event_id = f'evt_{uuid.uuid4().hex}'
+    assert main._webhook_event_ids.add(event_id, True)
+
+    processor = main.PaymentEventProcessor(batch_size=10, batch_wait=0, maxsize=10)
+    processor._apply([(event_id, ('user', True, 1_700_000_000))])
+
+    assert processor.stats()['failed'] == 1
+    # Un reenvío del evento se vuelve a procesar
+    assert main._webhook_event_ids.add(event_id, True)
+
+WEBHOOK_SECRET = 'whsec_test'
+
+def _webhook(client, event, timestamp=None, signature=None):
+    payload = json.dumps(event).encode('utf-8')
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    if signature is None:
+        signature = hmac.new(WEBHOOK_SECRET.encode('utf-8'), f'{timestamp}.'.encode('ascii') + payload, hashlib.sha256).hexdigest()
+    return client.post('/api/payments/webhook', data=payload, content_type='application/json',
+                       headers={'Stripe-Signature': f't={timestamp},v1={signature}'})
+
+def _checkout_event(user_id):
+    return {
+        'id': f'evt_{uuid.uuid4().hex}', 'type': 'checkout.session.completed', 'created': int(time.time()),
+        'data': {'object': {'client_reference_id': user_id, 'payment_status': 'paid'}}
+    }
+
+def test_webhook_rejects_bad_signatures(client, supabase, monkeypatch):
+    monkeypatch.setattr(main, 'PAYMENT_WEBHOOK_SECRET', WEBHOOK_SECRET)
+    event = _checkout_event(str(uuid.uuid4()))
+    assert _webhook(client, event, signature='0' * 64).status_code == 400
+    assert _webhook(client, event, signature='é').status_code == 400
+    # Firma válida pero fuera de la tolerancia: un replay de un evento viejo
+    assert _webhook(client, event, timestamp=int(time.time()) - main.PAYMENT_WEBHOOK_TOLERANCE - 60).status_code == 400
+    assert supabase.profiles == {}
+
+def test_webhook_applies_event_once(client, supabase, monkeypatch):
+    monkeypatch.setattr(main, 'PAYMENT_WEBHOOK_SECRET', WEBHOOK_SECRET)
+    user_id = str(uuid.uuid4())
+    event = _checkout_event(user_id)
+    assert _webhook(client, event).status_code == 200
+    assert supabase.profiles[user_id]['is_premium'] is True
+
+    supabase.profiles[user_id]['is_premium'] = False
+    response = _webhook(client, event)
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'Webhook ya recibido'
+    assert supabase.profiles[user_id]['is_premium'] is False
@@ -0,0 +1,42 @@
+import main
+
+WIZARD = {
+    'step3': {'familyStatus': 'family'},
+    'step5': {'currentSavings': 900000},
+    'step6': {'country': 'usa'},
+    'step7': {'state': 'california', 'city': 'los-angeles'},
+}
+
+def test_unchanged_inputs_reuse_stored_report(client, supabase, auth_headers, monkeypatch):
+    headers = auth_headers()
+    assert client.post('/api/simulations', json=WIZARD, headers=headers).status_code == 200
+    first = client.post('/api/reports/generate', json={}, headers=headers).get_json()
+    assert first['success'] and first['cached'] is False
+
+    updates = []
+    original_update = supabase.update
+    monkeypatch.setattr(supabase, 'update', lambda *args: updates.append(args) or original_update(*args))
+    second = client.post('/api/reports/generate', json={}, headers=headers).get_json()
+    assert second['cached'] is True
+    assert second['data'] == first['data']
+    assert updates == []
+
+def _generate_in_mode(client, supabase, auth_headers, monkeypatch, storage):
+    monkeypatch.setattr(main, 'SIMULATION_STORAGE', storage)
+    monkeypatch.setattr(supabase, 'storage', storage)
+    # Sin el caché compartido por hash: cada modo tiene que calcular con lo que leyó de la base
+    main._report_cache.discard_where(lambda report: True)
+    headers = auth_headers(f'{storage}@example.com')
+    assert client.post('/api/simulations', json={**WIZARD, 'step1': {'name': 'Ana'}}, headers=headers).status_code == 200
+    report = client.post('/api/reports/generate', json={}, headers=headers).get_json()['data']
+    report['metadata'].pop('generatedAt')
+    return report
+
+def test_jsonb_projection_matches_text_storage(client, supabase, auth_headers, monkeypatch):
+    text_report = _generate_in_mode(client, supabase, auth_headers, monkeypatch, 'text')
+    jsonb_report = _generate_in_mode(client, supabase, auth_headers, monkeypatch, 'jsonb')
+    assert jsonb_report == text_report
+
+    expected = main.calculate_financial_analysis(WIZARD)
+    assert jsonb_report['metadata']['location'] == expected['metadata']['location']
+    assert jsonb_report['summary'] == expected['summary']
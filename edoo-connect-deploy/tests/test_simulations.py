@@ -0,0 +1,75 @@
+import main
+
+WIZARD_A = {'step1': {'name': 'Ana'}, 'step5': {'currentSavings': 45000}}
+WIZARD_B = {'step1': {'name': 'Ana'}, 'step5': {'currentSavings': 60000}}
+
+def _save(client, headers, wizard):
+    response = client.post('/api/simulations', json=wizard, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['data']['written']
+
+def _stored_wizard(supabase, headers):
+    user_id = main.authenticate_token(headers['Authorization'].split()[1])['id']
+    return main.decode_document(supabase.simulations[user_id]['wizard_data'])
+
+def test_identical_save_is_skipped(client, auth_headers):
+    headers = auth_headers()
+    assert _save(client, headers, WIZARD_A) is True
+    assert _save(client, headers, WIZARD_A) is False
+
+def test_save_after_write_from_another_worker_is_not_lost(client, supabase, auth_headers):
+    headers = auth_headers()
+    assert _save(client, headers, WIZARD_A) is True
+    # Otro worker guarda B: este proceso no se entera
+    user_id = main.authenticate_token(headers['Authorization'].split()[1])['id']
+    supabase.save_simulation({'p_user_id': user_id, 'p_wizard_data': WIZARD_B, 'p_wizard_hash': main.content_hash(WIZARD_B)})
+    assert _save(client, headers, WIZARD_A) is True
+    assert _stored_wizard(supabase, headers) == WIZARD_A
+
+def test_save_after_step_patch_is_written(client, supabase, auth_headers):
+    headers = auth_headers()
+    assert _save(client, headers, WIZARD_A) is True
+    response = client.patch('/api/simulations/step/5', json={'data': {'currentSavings': 1}}, headers=headers)
+    assert response.status_code == 200
+    assert _save(client, headers, WIZARD_A) is True
+    assert _stored_wizard(supabase, headers) == WIZARD_A
+
+def test_current_simulation_reads_only_wizard_columns(client, supabase, auth_headers, monkeypatch):
+    headers = auth_headers()
+    assert _save(client, headers, WIZARD_A) is True
+    selects = []
+    select = supabase.select
+    monkeypatch.setattr(supabase, 'select', lambda table, query: selects.append(query.get('select')) or select(table, query))
+
+    response = client.get('/api/simulations/current', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['data']['wizardData'] == WIZARD_A
+    assert selects == [['wizard_data,status,step_versions']]
+
+def _patch_step(client, headers, step, data, version=None):
+    body = {'data': data} if version is None else {'data': data, 'version': version}
+    return client.patch(f'/api/simulations/step/{step}', json=body, headers=headers)
+
+def test_step_patch_merges_into_stored_wizard(client, supabase, auth_headers):
+    headers = auth_headers()
+    assert _save(client, headers, WIZARD_A) is True
+    response = _patch_step(client, headers, 5, {'monthlyIncome': 3000})
+    assert response.status_code == 200
+    assert response.get_json()['data']['version'] == 1
+    assert _stored_wizard(supabase, headers) == {
+        'step1': {'name': 'Ana'}, 'step5': {'currentSavings': 45000, 'monthlyIncome': 3000}
+    }
+
+def test_step_patch_with_stale_version_conflicts(client, supabase, auth_headers):
+    headers = auth_headers()
+    assert _patch_step(client, headers, 2, {'migrationGoal': 'study'}, version=0).status_code == 200
+    # Otra pestaña ya escribió la versión 1: un PATCH basado en la 0 no la pisa
+    response = _patch_step(client, headers, 2, {'migrationGoal': 'work'}, version=0)
+    assert response.status_code == 409
+    assert response.get_json()['data'] == {'step': 2, 'version': 1}
+    assert _stored_wizard(supabase, headers)['step2'] == {'migrationGoal': 'study'}
+    assert _patch_step(client, headers, 2, {'migrationGoal': 'work'}, version=1).status_code == 200
+
+def test_step_patch_rejects_invalid_step(client, auth_headers):
+    headers = auth_headers()
+    assert _patch_step(client, headers, 12, {'a': 1}).status_code == 400
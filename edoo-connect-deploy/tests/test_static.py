@@ -0,0 +1,32 @@
+import main
+
+def test_spa_routes_do_not_rescan_static_dir(tmp_path, monkeypatch):
+    (tmp_path / 'index.html').write_text('<html></html>')
+    monkeypatch.setattr(main, 'STATIC_RESCAN_INTERVAL', 0)
+    manifest = main.StaticManifest(str(tmp_path))
+    scans = []
+    scan = manifest.scan
+    monkeypatch.setattr(manifest, 'scan', lambda: scans.append(1) or scan())
+
+    assert manifest.lookup('index.html') is not None
+    assert len(scans) == 1
+    for path in ('dashboard', 'simulacion/3', 'reporte/resumen'):
+        assert manifest.lookup(path) is None
+    assert len(scans) == 1
+
+    # Un archivo publicado después sí se encuentra
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'assets' / 'app-1a2b.js').write_text('console.log(1)')
+    assert manifest.lookup('assets/app-1a2b.js') is not None
+    assert len(scans) == 2
+
+def test_static_assets_are_served_with_brotli(client, tmp_path, monkeypatch):
+    (tmp_path / 'assets').mkdir()
+    script = 'console.log("edoo");\n' * 200
+    (tmp_path / 'assets' / 'app-1a2b.js').write_text(script)
+    monkeypatch.setattr(main, '_static_manifest', main.StaticManifest(str(tmp_path)))
+
+    response = client.get('/assets/app-1a2b.js', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'br'
+    assert main.brotli.decompress(response.data).decode('utf-8') == script
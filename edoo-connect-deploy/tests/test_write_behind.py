@@ -0,0 +1,55 @@
+import threading
+
+import main
+
+def _saves():
+    with main._save_stats_lock:
+        return dict(main._save_stats)
+
+def test_user_flush_does_not_wait_for_batch(monkeypatch):
+    slow_started, release = threading.Event(), threading.Event()
+    written = []
+
+    def upsert(user_id, wizard_data, wizard_hash=None):
+        if user_id == 'slow':
+            slow_started.set()
+            assert release.wait(5)
+        written.append(user_id)
+        return True
+
+    monkeypatch.setattr(main, 'upsert_simulation', upsert)
+    monkeypatch.setattr(main, 'ASYNC_IO', False)
+    buffer = main.SimulationWriteBehind(interval=60)
+    buffer._pending = {'slow': ({'a': 1}, 'h1')}
+    batch = threading.Thread(target=buffer.flush)
+    batch.start()
+    assert slow_started.wait(5)
+
+    buffer._pending['fast'] = ({'b': 1}, 'h2')
+    buffer.flush('fast')
+    assert written == ['fast']
+    # El guardado en vuelo sigue visible para read-your-writes
+    assert buffer.pending('slow') == {'a': 1}
+
+    release.set()
+    batch.join(5)
+    assert written == ['fast', 'slow']
+    assert buffer.pending('slow') is None
+
+def test_queued_saves_are_counted_by_outcome(monkeypatch):
+    results = iter([True, False])
+    monkeypatch.setattr(main, 'upsert_simulation', lambda *args: next(results))
+    buffer = main.SimulationWriteBehind(interval=60)
+    monkeypatch.setattr(buffer, 'start', lambda: None)
+    before = _saves()
+
+    buffer.enqueue('user', {'v': 1}, 'h1')
+    buffer.enqueue('user', {'v': 2}, 'h2')
+    buffer.flush('user')
+    buffer.enqueue('user', {'v': 2}, 'h2')
+    buffer.flush('user')
+
+    after = _saves()
+    assert {key: after[key] - before[key] for key in after} == {
+        'requests': 3, 'writes': 1, 'skipped': 1, 'coalesced': 1
+    }
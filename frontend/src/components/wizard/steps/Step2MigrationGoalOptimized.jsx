@@ -68,14 +68,14 @@ const additionalConsiderations = [
 export function Step2MigrationGoalOptimized() {
   const { formData, setStepData } = useWizardStore();
   const [selectedGoal, setSelectedGoal] = useState(
-    formData.migrationGoal || migrationGoals[0].id
+    formData.step2?.migrationGoal || migrationGoals[0].id
   );
   const [selectedConsiderations, setSelectedConsiderations] = useState(
-    formData.additionalConsiderations || []
+    formData.step2?.additionalConsiderations || []
   );
 
   useEffect(() => {
-    setStepData({ migrationGoal: selectedGoal, additionalConsiderations: selectedConsiderations });
+    setStepData(2, { migrationGoal: selectedGoal, additionalConsiderations: selectedConsiderations });
   }, [selectedGoal, selectedConsiderations, setStepData]);
 
   const currentHelpText = migrationGoals.find(
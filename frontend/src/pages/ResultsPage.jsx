@@ -75,11 +75,13 @@ const ResultsPage = () => {
 
   const handleExportPDF = async () => {
     try {
-      const response = await reportsService.exportToPDF();
-      if (response.success) {
-        // TODO: Implementar descarga de PDF
-        alert('Función de exportación PDF en desarrollo');
-      }
+      const pdf = await reportsService.exportToPDF();
+      const url = URL.createObjectURL(pdf);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = 'edooconnect-analisis.pdf';
+      link.click();
+      setTimeout(() => URL.revokeObjectURL(url), 0);
     } catch (error) {
       console.error('Error exporting PDF:', error);
       alert('Error al exportar PDF');
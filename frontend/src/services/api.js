@@ -50,6 +50,7 @@ export const authService = {
 // Servicios de simulaciones
 export const simulationService = {
   saveWizardData: (data) => api.post('/simulations', data),
+  saveStepData: (step, data, version) => api.patch(`/simulations/step/${step}`, { data, version }),
   getCurrentSimulation: () => api.get('/simulations/current'),
   getUserSimulations: () => api.get('/simulations'),
   getSimulationById: (id) => api.get(`/simulations/${id}`),
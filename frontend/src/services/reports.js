@@ -3,13 +3,17 @@ import api from './api';
 // Servicios de reportes y análisis financiero
 export const reportsService = {
   // Generar nuevo análisis financiero
-  generateAnalysis: () => api.post('/reports/generate'),
+  // options.projection: { months, inflation, tuitionSchedule, compact }
+  generateAnalysis: (options) => api.post('/reports/generate', options),
+  
+  // Comparar escenarios sin guardar: axes = [{ field: 'step6.country', values: ['canada', 'usa'] }, ...]
+  whatIf: (base, axes) => api.post('/reports/what-if', { base, axes }),
   
   // Obtener análisis existente
   getCurrentAnalysis: () => api.get('/reports/current'),
   
-  // Exportar análisis a PDF (solo premium)
-  exportToPDF: () => api.get('/reports/export/pdf'),
+  // Exportar análisis a PDF (solo premium); devuelve el archivo como Blob
+  exportToPDF: () => api.get('/reports/export/pdf', { responseType: 'blob' }),
 };
 
 export default reportsService;
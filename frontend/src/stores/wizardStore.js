@@ -1,6 +1,13 @@
 import { create } from 'zustand';
 import { simulationService } from '../services/api';
 
+// Los pasos llaman a setStepData en cada tecla: se espera a que el usuario pare de
+// escribir y cada paso tiene como máximo un PATCH en vuelo, que lleva la versión
+// devuelta por el anterior. Dos PATCH simultáneos mandarían la misma versión y el
+// segundo volvería con 409 aunque viniera de esta misma pestaña.
+const STEP_SAVE_DEBOUNCE_MS = 400;
+const stepSaves = {}; // stepKey -> { timer, pending, inFlight }
+
 const useWizardStore = create((set, get) => ({
   // Estado del wizard
   currentStep: 1,
@@ -18,6 +25,7 @@ const useWizardStore = create((set, get) => ({
     step10: {}, // Perfil profesional
     step11: {}, // Perfil del cónyuge
   },
+  stepVersions: {}, // Versión por paso para detectar cambios desde otra pestaña
   isLoading: false,
   error: null,
   simulationId: null,
@@ -44,32 +52,59 @@ const useWizardStore = create((set, get) => ({
   },
 
   // Acciones de datos
-  setStepData: async (step, data) => {
-    const { formData } = get();
-    const updatedFormData = {
-      ...formData,
-      [`step${step}`]: { ...formData[`step${step}`], ...data },
-    };
-    
+  setStepData: (step, data) => {
+    const { formData, totalSteps } = get();
+    // El paso va en la URL del PATCH: sin esta guarda, setStepData(data) pedía /step/[object Object]
+    if (!Number.isInteger(step) || step < 1 || step > totalSteps) {
+      console.error('setStepData: paso inválido', step);
+      return;
+    }
+    const stepKey = `step${step}`;
     set({ 
-      formData: updatedFormData,
-      isLoading: true,
+      formData: {
+        ...formData,
+        [stepKey]: { ...formData[stepKey], ...data },
+      },
       error: null 
     });
 
-    // Guardar en el backend automáticamente
+    // Guardar en el backend solo los campos modificados del paso, agrupando la ráfaga
+    const save = stepSaves[stepKey] || (stepSaves[stepKey] = { timer: null, pending: null, inFlight: false });
+    save.pending = { ...save.pending, ...data };
+    clearTimeout(save.timer);
+    save.timer = setTimeout(() => {
+      save.timer = null;
+      get().flushStepData(step);
+    }, STEP_SAVE_DEBOUNCE_MS);
+  },
+
+  // Envía lo acumulado del paso; si ya hay un PATCH en vuelo, se reenvía al terminar
+  flushStepData: async (step) => {
+    const stepKey = `step${step}`;
+    const save = stepSaves[stepKey];
+    if (!save || save.inFlight || !save.pending) return;
+
+    const data = save.pending;
+    save.pending = null;
+    save.inFlight = true;
+    set({ isLoading: true });
     try {
-      const response = await simulationService.saveWizardData(updatedFormData);
-      set({ 
-        simulationId: response.data.simulation.id,
-        isLoading: false 
-      });
+      const response = await simulationService.saveStepData(step, data, get().stepVersions[stepKey]);
+      set({ stepVersions: { ...get().stepVersions, [stepKey]: response.data.version } });
     } catch (error) {
       console.error('Error al guardar datos del wizard:', error);
       set({ 
-        error: 'Error al guardar los datos',
-        isLoading: false 
+        error: error?.data?.version !== undefined
+          ? 'Este paso fue modificado desde otra sesión. Recarga para ver los cambios.'
+          : 'Error al guardar los datos'
       });
+    } finally {
+      save.inFlight = false;
+    }
+    if (save.pending && !save.timer) {
+      get().flushStepData(step);
+    } else if (!Object.values(stepSaves).some((s) => s.inFlight || s.pending)) {
+      set({ isLoading: false });
     }
   },
 
@@ -85,6 +120,12 @@ const useWizardStore = create((set, get) => ({
           simulationId: id,
           isLoading: false,
         });
+      } else if (response.data && response.data.wizardData) {
+        set({
+          formData: { ...get().formData, ...response.data.wizardData },
+          stepVersions: response.data.stepVersions || {},
+          isLoading: false,
+        });
       } else {
         set({ isLoading: false });
       }
@@ -99,6 +140,10 @@ const useWizardStore = create((set, get) => ({
 
   // Reiniciar wizard
   resetWizard: () => {
+    Object.keys(stepSaves).forEach((stepKey) => {
+      clearTimeout(stepSaves[stepKey].timer);
+      delete stepSaves[stepKey];
+    });
     set({
       currentStep: 1,
       formData: {
@@ -114,6 +159,7 @@ const useWizardStore = create((set, get) => ({
         step10: {},
         step11: {},
       },
+      stepVersions: {},
       simulationId: null,
       error: null,
     });